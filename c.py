@@ -4,11 +4,19 @@ import json
 import sys
 import time
 import os
+import itertools
+import copy
+import pickle
+import struct
+import bisect
+import zlib
+from array import array
 
 # ==========================================
 # 1. 物理內核 V6
 # ==========================================
 class PhysicsKernel:
+    """物理參數集：類別屬性為預設值，每個引擎持有自己的實例"""
     G_CONST = 0.8
     C_SPEED = 15.0
     COOLING_RATE = 0.995
@@ -20,6 +28,15 @@ class PhysicsKernel:
     BOUNDARY_START = 0.78
     TIDAL_SHRED_THRESHOLD = 0.95
 
+    PARAM_KEYS = {"G":"G_CONST","C":"C_SPEED","CR":"COOLING_RATE",
+                  "SC":"SOLAR_CONSTANT","UR":"UNIVERSE_RADIUS",
+                  "US":"UNIVERSE_SPIN","EI":"ENERGY_INJECT_INTERVAL",
+                  "EC":"ENERGY_INJECT_COUNT","BS":"BOUNDARY_START",
+                  "TS":"TIDAL_SHRED_THRESHOLD"}
+
+    def __init__(self, params=None):
+        self.import_params(params)
+
     @staticmethod
     def get_density(spin):
         return 1.0 / (1.0 + spin * 0.002)
@@ -28,41 +45,25 @@ class PhysicsKernel:
     def get_radius(mass, spin):
         return math.sqrt(mass / PhysicsKernel.get_density(spin)) * 3.0
 
-    @staticmethod
-    def apply_relativity(vx, vy):
+    def apply_relativity(self, vx, vy):
         speed = math.hypot(vx, vy)
-        if speed > PhysicsKernel.C_SPEED:
-            s = PhysicsKernel.C_SPEED / speed
+        if speed > self.C_SPEED:
+            s = self.C_SPEED / speed
             return vx * s, vy * s
         return vx, vy
 
-    @staticmethod
-    def calc_equilibrium_temp(star_temp, dist):
-        rad = (star_temp * PhysicsKernel.SOLAR_CONSTANT) / (dist * dist + 1.0)
-        return rad / (1.0 - PhysicsKernel.COOLING_RATE)
+    def calc_equilibrium_temp(self, star_temp, dist):
+        rad = (star_temp * self.SOLAR_CONSTANT) / (dist * dist + 1.0)
+        return rad / (1.0 - self.COOLING_RATE)
 
-    @staticmethod
-    def export_params():
-        return {
-            "G": PhysicsKernel.G_CONST, "C": PhysicsKernel.C_SPEED,
-            "CR": PhysicsKernel.COOLING_RATE, "SC": PhysicsKernel.SOLAR_CONSTANT,
-            "UR": PhysicsKernel.UNIVERSE_RADIUS, "US": PhysicsKernel.UNIVERSE_SPIN,
-            "EI": PhysicsKernel.ENERGY_INJECT_INTERVAL,
-            "EC": PhysicsKernel.ENERGY_INJECT_COUNT,
-            "BS": PhysicsKernel.BOUNDARY_START,
-            "TS": PhysicsKernel.TIDAL_SHRED_THRESHOLD
-        }
+    def export_params(self):
+        return {short: getattr(self, full) for short, full in self.PARAM_KEYS.items()}
 
-    @staticmethod
-    def import_params(data):
+    def import_params(self, data):
+        """只修改本實例，不影響其他引擎"""
         if not data: return
-        m = {"G":"G_CONST","C":"C_SPEED","CR":"COOLING_RATE",
-             "SC":"SOLAR_CONSTANT","UR":"UNIVERSE_RADIUS",
-             "US":"UNIVERSE_SPIN","EI":"ENERGY_INJECT_INTERVAL",
-             "EC":"ENERGY_INJECT_COUNT","BS":"BOUNDARY_START",
-             "TS":"TIDAL_SHRED_THRESHOLD"}
-        for short, full in m.items():
-            if short in data: setattr(PhysicsKernel, full, data[short])
+        for short, full in self.PARAM_KEYS.items():
+            if short in data: setattr(self, full, data[short])
 
 
 # ==========================================
@@ -84,6 +85,10 @@ class CelestialBody:
         self.in_buffer_zone = False
         self.tidal_damage = 0.0
         self.shred_immunity = 0        # 碎片免疫期
+        self.th_until = 0              # 熱力學快轉：此步以前免檢查（0 = 無錨點）
+        self.th_s = 0                  # 第一個尚未結算的步
+        self.th_d2 = 0.0               # 錨點的距離平方
+        self.th_q = 0.0                # 錨點的輻射輸入
 
     def to_compact(self):
         return [
@@ -113,7 +118,7 @@ class CelestialBody:
         b = CelestialBody(arr[1], arr[2], arr[5], arr[6], arr[7])
         b.cid = arr[0]
         b.vx = arr[3]; b.vy = arr[4]
-        b.radius = arr[8]
+        b.radius = PhysicsKernel.get_radius(b.mass, b.spin)
         b.composition = {"Fe": arr[9], "Si": arr[10], "Vo": arr[11]}
         b.axial_tilt = arr[12]
         b.is_star = (arr[13] == 1)
@@ -125,7 +130,9 @@ class CelestialBody:
         if len(arr) > 18: b.shred_immunity = arr[18]
         return b
 
-    def update_thermodynamics(self, main_star):
+    def update_thermodynamics(self, main_star, pk, tol=0.0, now=0):
+        """熱力學；tol > 0 時在容差帶內快轉，由 sync_temp 一次結算"""
+        # 半徑只在質量或自轉改變時重算（合併、撕碎處已更新）
         if not self.is_active: return
         if self.is_star:
             target = 5500 + (self.mass * 0.1)
@@ -135,20 +142,43 @@ class CelestialBody:
             return
         dx = self.x - main_star.x; dy = self.y - main_star.y
         dist_sq = dx * dx + dy * dy + 1.0
-        rad_in = (main_star.temp * PhysicsKernel.SOLAR_CONSTANT) / dist_sq
-        self.temp = (self.temp * PhysicsKernel.COOLING_RATE) + rad_in
+        if tol:
+            # 距離平方留在相對容差帶內就沿用錨點的輻射輸入 q；引擎在 th_until 前不再呼叫
+            if not (self.th_until and abs(dist_sq - self.th_d2) <= tol * self.th_d2):
+                self.sync_temp(pk, now - 1)
+                self.th_s = now
+                self.th_d2 = dist_sq
+                self.th_q = (main_star.temp * pk.SOLAR_CONSTANT) / dist_sq
+            # 容差帶以徑向速度估算可安全跳過的步數
+            d = math.sqrt(dist_sq)
+            vr = abs(dx * self.vx + dy * self.vy) / d
+            self.th_until = now + min(50, int(tol * d / (2.0 * vr + 0.05)))
+            return
+        rad_in = (main_star.temp * pk.SOLAR_CONSTANT) / dist_sq
+        self.temp = (self.temp * pk.COOLING_RATE) + rad_in
         if self.temp < -273.15: self.temp = -273.15
-        self.radius = PhysicsKernel.get_radius(self.mass, self.spin)
 
-    def move(self):
-        self.vx, self.vy = PhysicsKernel.apply_relativity(self.vx, self.vy)
+    def sync_temp(self, pk, upto):
+        """結算 th_s..upto 共 k 步：T_k = CR^k T_0 + q (1 - CR^k) / (1 - CR)"""
+        if not self.th_until: return
+        k = upto - self.th_s + 1
+        if k <= 0: return
+        cr = pk.COOLING_RATE
+        ck = cr ** k
+        self.temp = self.temp * ck + self.th_q * (1.0 - ck) / (1.0 - cr)
+        if self.temp < -273.15: self.temp = -273.15
+        self.th_s = upto + 1
+
+    def move(self, pk):
+        self.vx, self.vy = pk.apply_relativity(self.vx, self.vy)
         self.x += self.vx; self.y += self.vy
 
     def apply_black_hole_boundary(self, center, engine):
         """黑洞邊界：流動膜 + 潮汐撕碎 + 物質回收"""
         dx = self.x - center; dy = self.y - center
         dist = math.hypot(dx, dy)
-        R = PhysicsKernel.UNIVERSE_RADIUS
+        pk = engine.pk
+        R = pk.UNIVERSE_RADIUS
 
         # 免疫期中：只做硬邊界檢查
         if self.shred_immunity > 0:
@@ -161,8 +191,8 @@ class CelestialBody:
                 self.vx *= 0.05; self.vy *= 0.05
             return
 
-        buf_start = R * PhysicsKernel.BOUNDARY_START
-        shred_zone = R * PhysicsKernel.TIDAL_SHRED_THRESHOLD
+        buf_start = R * pk.BOUNDARY_START
+        shred_zone = R * pk.TIDAL_SHRED_THRESHOLD
 
         self.in_buffer_zone = False
 
@@ -174,6 +204,7 @@ class CelestialBody:
 
         # ---- 進入邊界緩衝帶 ----
         self.in_buffer_zone = True
+        self.sync_temp(pk, engine.total_steps_run)
         depth = (dist - buf_start) / (R - buf_start)
         depth = min(depth, 0.99)
 
@@ -210,6 +241,7 @@ class CelestialBody:
         """部分撕碎：損失質量，碎片向內飛"""
         loss_pct = random.uniform(0.2, 0.4) * self.tidal_damage
         lost_mass = self.mass * loss_pct
+        engine.log_event(EventLog.SHRED_PARTIAL, self, m2=lost_mass)
         self.mass -= lost_mass
         self.radius = PhysicsKernel.get_radius(self.mass, self.spin)
         for k in self.composition:
@@ -232,7 +264,8 @@ class CelestialBody:
                 speed = random.uniform(2, 5)
                 frag.vx = (cdx / cd) * speed + random.uniform(-0.5, 0.5)
                 frag.vy = (cdy / cd) * speed + random.uniform(-0.5, 0.5)
-            engine.bodies.append(frag)
+            engine.add_body(frag)
+            engine.log_event(EventLog.FRAGMENT, frag, self)
             engine.recycled_mass += fm
             engine.recycled_count += 1
 
@@ -242,6 +275,7 @@ class CelestialBody:
         """完全撕碎：整個天體變成碎片雨"""
         n_frags = random.randint(2, 4)
         fm = self.mass / n_frags
+        engine.log_event(EventLog.SHRED_COMPLETE, self, m2=self.mass)
         for _ in range(n_frags):
             if fm < 0.5: continue
             angle = random.uniform(0, 6.2832)
@@ -257,7 +291,8 @@ class CelestialBody:
                 speed = random.uniform(3, 6)
                 frag.vx = (cdx / cd) * speed + random.uniform(-1, 1)
                 frag.vy = (cdy / cd) * speed + random.uniform(-1, 1)
-            engine.bodies.append(frag)
+            engine.add_body(frag)
+            engine.log_event(EventLog.FRAGMENT, frag, self)
             engine.recycled_mass += fm
             engine.recycled_count += 1
 
@@ -266,17 +301,18 @@ class CelestialBody:
     def calc_kinetic_energy(self):
         return 0.5 * self.mass * (self.vx ** 2 + self.vy ** 2)
 
-    def calc_potential_energy(self, star):
+    def calc_potential_energy(self, star, pk):
         d = math.hypot(self.x - star.x, self.y - star.y)
         if d < 1: d = 1
-        return -PhysicsKernel.G_CONST * star.mass * self.mass / d
+        return -pk.G_CONST * star.mass * self.mass / d
 
 
 # ==========================================
 # 3. 創世引擎（物質回收版）
 # ==========================================
 class GenesisEngine:
-    def __init__(self):
+    def __init__(self, params=None):
+        self.pk = PhysicsKernel(params)
         self.bodies = []
         self.center_pos = 5000
         self.current_epoch = 0
@@ -290,11 +326,30 @@ class GenesisEngine:
         self.recycled_mass = 0.0
         self.recycled_count = 0
         self.epoch_history = []
+        self.event_log = None           # 選用：EventLog 事件流
+        self.ccd = False                # 選用：連續碰撞偵測
+        self.thermal_tol = 0.0          # 選用：熱力學快轉容差，0 = 每步精確
+        self.next_cid = 100000          # 唯一 cid 配發器
+        self.mem_trace = False          # 選用：每個 epoch 的記憶體量測
+        self._mem = None                # 量測中：各階段淨配置位元組
+        self.field_stream = None        # 選用：FieldStream 密度場輸出
+        self.fused = True               # 中心位勢融合核心（False = 逐方法的原始路徑）
+        self.index = BodyIndex(self)
+
+    def add_body(self, b):
+        """配發唯一 cid 後加入；所有新天體都經過這裡"""
+        b.cid = self.next_cid
+        self.next_cid += 1
+        self.bodies.append(b)
+        return b
 
     def to_compact(self):
+        self.sync_thermal()
         return {
             "r": self.run_id, "e": self.current_epoch,
             "s": self.total_steps_run,
+            "pp": self.pk.export_params(),
+            "nc": self.next_cid,
             "n": len([b for b in self.bodies if b.is_active]),
             "sv": {
                 "be": self.boundary_events,
@@ -313,6 +368,7 @@ class GenesisEngine:
         self.run_id = data.get("r", self.run_id)
         self.current_epoch = data.get("e", 0)
         self.total_steps_run = data.get("s", 0)
+        self.pk.import_params(data.get("pp"))
         sv = data.get("sv", {})
         self.boundary_events = sv.get("be", 0)
         self.injected_mass_total = sv.get("im", 0)
@@ -325,13 +381,22 @@ class GenesisEngine:
         self.bodies = []
         for arr in data.get("b", []):
             self.bodies.append(CelestialBody.from_compact(arr))
+        # 舊存檔的 cid 是亂數，可能重複：保留第一個，其餘重新配發
+        self.next_cid = max([data.get("nc", 100000)] + [b.cid + 1 for b in self.bodies])
+        seen = set()
+        for b in self.bodies:
+            if b.cid in seen:
+                b.cid = self.next_cid; self.next_cid += 1
+            seen.add(b.cid)
+        self.index.invalidate()
 
     def big_bang(self, n_particles):
         self.bodies = []
+        pk = self.pk
         center = self.center_pos
         sun = CelestialBody(center, center, 6000, 5, 5500)
         sun.is_star = True; sun.origin = "bigbang"
-        self.bodies.append(sun)
+        self.add_body(sun)
         for i in range(n_particles):
             dist = random.uniform(400, 2200)
             angle = random.uniform(0, 6.2832)
@@ -339,22 +404,23 @@ class GenesisEngine:
             by = center + math.sin(angle) * dist
             mass = random.uniform(5.0, 30.0)
             spin = random.uniform(1, 10)
-            est = PhysicsKernel.calc_equilibrium_temp(5500, dist)
+            est = pk.calc_equilibrium_temp(5500, dist)
             body = CelestialBody(bx, by, mass, spin, est * random.uniform(0.5, 1.5))
             body.birth_dist = dist; body.origin = "bigbang"
-            v_orb = math.sqrt(PhysicsKernel.G_CONST * sun.mass / dist)
+            v_orb = math.sqrt(pk.G_CONST * sun.mass / dist)
             body.vx = -math.sin(angle) * v_orb + random.uniform(-0.15, 0.15)
             body.vy = math.cos(angle) * v_orb + random.uniform(-0.15, 0.15)
-            body.vx += -math.sin(angle) * v_orb * PhysicsKernel.UNIVERSE_SPIN
-            body.vy += math.cos(angle) * v_orb * PhysicsKernel.UNIVERSE_SPIN
-            self.bodies.append(body)
+            body.vx += -math.sin(angle) * v_orb * pk.UNIVERSE_SPIN
+            body.vy += math.cos(angle) * v_orb * pk.UNIVERSE_SPIN
+            self.add_body(body)
 
     def inject_external_energy(self, step):
-        if step % PhysicsKernel.ENERGY_INJECT_INTERVAL != 0: return
+        pk = self.pk
+        if step % pk.ENERGY_INJECT_INTERVAL != 0: return
         center = self.center_pos
-        for _ in range(PhysicsKernel.ENERGY_INJECT_COUNT):
+        for _ in range(pk.ENERGY_INJECT_COUNT):
             angle = random.uniform(0, 6.2832)
-            sd = PhysicsKernel.UNIVERSE_RADIUS * PhysicsKernel.BOUNDARY_START * 0.95
+            sd = pk.UNIVERSE_RADIUS * pk.BOUNDARY_START * 0.95
             bx = center + math.cos(angle) * sd
             by = center + math.sin(angle) * sd
             mass = random.uniform(3.0, 12.0)
@@ -366,41 +432,102 @@ class GenesisEngine:
             tan = ins * random.uniform(0.3, 0.8)
             body.vx += -math.sin(angle) * tan
             body.vy += math.cos(angle) * tan
-            self.bodies.append(body)
+            self.add_body(body)
+            self.log_event(EventLog.INJECT, body, step=step)
             self.injected_mass_total += mass
             self.injected_count += 1
 
     def run_epoch(self, steps):
         main_star = self.bodies[0]
-        cell_size = 50; center = self.center_pos
+        log = self.event_log
+        if self.mem_trace: self._mem_begin()
 
         for step in range(steps):
-            self.inject_external_energy(self.total_steps_run)
-            self.total_steps_run += 1
-            grid = {}
+            if log and log.due(self.total_steps_run):
+                log.checkpoint(self)
+                self._mem_mark("log")
+            self.step(main_star)
+            fs = self.field_stream
+            if fs and self.total_steps_run % fs.every == 0:
+                fs.write(self)
 
-            body_count = len(self.bodies)
-            for idx in range(body_count):
-                b = self.bodies[idx]
-                if not b.is_active: continue
-                b.update_thermodynamics(main_star)
-                b.move()
-                if not b.is_star:
-                    b.apply_black_hole_boundary(center, self)
-                if not b.is_active: continue
+            if step % 60 == 0:
+                self.bodies = [b for b in self.bodies if b.is_active]
+                self._mem_mark("compact")
 
-                gx = int(b.x / cell_size); gy = int(b.y / cell_size)
-                key = (gx, gy)
-                if key not in grid: grid[key] = []
-                grid[key].append(b)
-                if b is not main_star:
-                    ddx = main_star.x - b.x; ddy = main_star.y - b.y
-                    dsq = ddx * ddx + ddy * ddy + 100.0
-                    dd = math.sqrt(dsq)
-                    f = (PhysicsKernel.G_CONST * main_star.mass * b.mass) / dsq
-                    b.vx += (ddx / dd) * f / b.mass
-                    b.vy += (ddy / dd) * f / b.mass
+        self.sync_thermal()
+        self.absorbed_by_star = main_star.mass - 6000
+        snapshot = self.collect_snapshot()
+        self._mem_mark("snapshot")
+        entry = {
+            "ep": self.current_epoch,
+            "sn": snapshot,
+            "sm": round(main_star.mass, 1),
+            "ts": self.total_steps_run
+        }
+        if self._mem is not None: entry["mem"] = self._mem_end()
+        self.epoch_history.append(entry)
+        self.current_epoch += 1
+
+    MEM_PHASES = ("log", "inject", "integrate", "collide", "compact", "snapshot")
+
+    def _mem_begin(self):
+        """追蹤從第一個量測的 epoch 開始；要涵蓋初始天體，請在建立引擎前 tracemalloc.start()"""
+        import tracemalloc      # 只在開啟量測時載入，分析用的命令不付這份啟動成本
+        if not tracemalloc.is_tracing(): tracemalloc.start()
+        if hasattr(tracemalloc, "reset_peak"): tracemalloc.reset_peak()
+        cur = tracemalloc.get_traced_memory()[0]
+        self._mem = {"t": cur, "peak": cur, "grid": 0,
+                     "ph": dict.fromkeys(self.MEM_PHASES, 0),
+                     "pk": dict.fromkeys(self.MEM_PHASES, 0)}
+
+    def _mem_mark(self, phase):
+        """上次標記以來：淨配置累加到 ph[phase]，暫時高峰記到 pk[phase]"""
+        m = self._mem
+        if m is None: return
+        import tracemalloc
+        cur, peak = tracemalloc.get_traced_memory()
+        m["ph"][phase] += cur - m["t"]
+        m["pk"][phase] = max(m["pk"][phase], peak - m["t"])
+        m["peak"] = max(m["peak"], peak)
+        if hasattr(tracemalloc, "reset_peak"): tracemalloc.reset_peak()
+        m["t"] = cur
+
+    def _mem_end(self):
+        import tracemalloc
+        cur, peak = tracemalloc.get_traced_memory()
+        m = self._mem; self._mem = None
+        dead = sum(1 for b in self.bodies if not b.is_active)
+        frag = sum(1 for b in self.bodies if b.is_active and b.origin == "recycled")
+        return {
+            "cur": round(cur / 1024, 1),                               # KB
+            "peak": round(max(peak, m["peak"]) / 1024, 1),
+            "ph": {k: round(v / 1024, 1) for k, v in m["ph"].items()},
+            "pk": {k: round(v / 1024, 1) for k, v in m["pk"].items()},
+            "n": {"bodies": len(self.bodies), "live": len(self.bodies) - dead,
+                  "dead": dead, "frag": frag, "eh": len(self.epoch_history) + 1,
+                  "grid": m["grid"]}
+        }
+
+    def step(self, main_star=None):
+        """單步物理；不做清理與快照，供 run_epoch 與重播共用"""
+        if main_star is None: main_star = self.bodies[0]
+        center = self.center_pos
+
+        self.inject_external_energy(self.total_steps_run)
+        self.total_steps_run += 1
+        self._mem_mark("inject")
+        grid = {}
+        ccd = self.ccd; sweep = {}
+
+        if self.fused and main_star.x == center and main_star.y == center:
+            self._integrate_fused(main_star, grid, sweep)
+        else: self._integrate_reference(main_star, grid, sweep)
 
+        self._mem_mark("integrate")
+        if ccd:
+            self.merge_swept(grid, sweep)
+        else:
             for key in grid:
                 cell = grid[key]
                 if len(cell) < 2: continue
@@ -414,34 +541,232 @@ class GenesisEngine:
                         if cd < (b1.radius + b2.radius) * 0.8:
                             self.merge_bodies(b1, b2)
 
-            main_star.x = center; main_star.y = center
-            main_star.vx = 0; main_star.vy = 0
+        main_star.x = center; main_star.y = center
+        main_star.vx = 0; main_star.vy = 0
+        if self._mem is not None:
+            self._mem["grid"] = max(self._mem["grid"], len(grid))
+            del grid, sweep         # 網格在本步釋放，淨配置不會漏記到下一步的 inject
+            self._mem_mark("collide")
 
-            if step % 60 == 0:
-                self.bodies = [b for b in self.bodies if b.is_active]
+    def _integrate_reference(self, main_star, grid, sweep):
+        """逐天體呼叫 update_thermodynamics / move / apply_black_hole_boundary 的原始路徑"""
+        pk = self.pk
+        cell_size = 50; center = self.center_pos
+        ccd = self.ccd
+        tol = self.thermal_tol; now = self.total_steps_run
+
+        body_count = len(self.bodies)
+        for idx in range(body_count):
+            b = self.bodies[idx]
+            if not b.is_active: continue
+            if not tol or now > b.th_until:
+                b.update_thermodynamics(main_star, pk, tol, now)
+            x0 = b.x; y0 = b.y
+            b.move(pk)
+            if not b.is_star:
+                b.apply_black_hole_boundary(center, self)
+            if not b.is_active: continue
+
+            if ccd:
+                # 掃掠線段的包圍盒所覆蓋的格子都登記
+                sweep[b] = (x0, y0)
+                for gx in range(int(min(x0, b.x) / cell_size), int(max(x0, b.x) / cell_size) + 1):
+                    for gy in range(int(min(y0, b.y) / cell_size), int(max(y0, b.y) / cell_size) + 1):
+                        key = (gx, gy)
+                        if key not in grid: grid[key] = []
+                        grid[key].append(b)
+            else:
+                gx = int(b.x / cell_size); gy = int(b.y / cell_size)
+                key = (gx, gy)
+                if key not in grid: grid[key] = []
+                grid[key].append(b)
+            if b is not main_star:
+                ddx = main_star.x - b.x; ddy = main_star.y - b.y
+                dsq = ddx * ddx + ddy * ddy + 100.0
+                dd = math.sqrt(dsq)
+                f = (pk.G_CONST * main_star.mass * b.mass) / dsq
+                b.vx += (ddx / dd) * f / b.mass
+                b.vy += (ddy / dd) * f / b.mass
+
+    def _integrate_fused(self, main_star, grid, sweep):
+        """中心位勢融合核心，結果與 _integrate_reference 逐位元相同"""
+        pk = self.pk
+        cell_size = 50; center = self.center_pos
+        ccd = self.ccd
+        tol = self.thermal_tol; now = self.total_steps_run
+        sqrt = math.sqrt; hypot = math.hypot
+
+        # 主星先更新；整個積分迴圈中主星的溫度、質量、位置都不再改變
+        if main_star.is_active:
+            main_star.update_thermodynamics(main_star, pk)
+            main_star.move(pk)
+            key = (int(main_star.x / cell_size), int(main_star.y / cell_size))
+            if ccd: sweep[main_star] = (main_star.x, main_star.y)
+            grid[key] = [main_star]
+        sx = main_star.x; sy = main_star.y
+        flux = main_star.temp * pk.SOLAR_CONSTANT
+        gm = pk.G_CONST * main_star.mass
+        cr = pk.COOLING_RATE; c_lim = pk.C_SPEED; c2 = c_lim * c_lim
+        R = pk.UNIVERSE_RADIUS
+        buf2 = (R * pk.BOUNDARY_START) ** 2
+
+        bodies = self.bodies
+        # 每個天體在移動前後各算一次相對主星的偏移，熱力學、限速、邊界膜與重力共用
+        for idx in range(len(bodies)):      # 本步撕碎產生的碎片下一步才積分
+            b = bodies[idx]
+            if not b.is_active or b is main_star: continue
+            x0 = b.x; y0 = b.y
+            if tol:
+                if now > b.th_until: b.update_thermodynamics(main_star, pk, tol, now)
+            else:
+                dx = x0 - sx; dy = y0 - sy
+                t = (b.temp * cr) + flux / (dx * dx + dy * dy + 1.0)
+                b.temp = t if t >= -273.15 else -273.15
+
+            vx = b.vx; vy = b.vy
+            if vx * vx + vy * vy > c2:
+                k = c_lim / hypot(vx, vy)
+                vx *= k; vy *= k
+                b.vx = vx; b.vy = vy
+            x = x0 + vx; y = y0 + vy
+            b.x = x; b.y = y
+
+            ox = x - center; oy = y - center
+            d2 = ox * ox + oy * oy
+            # 只有緩衝帶內或免疫期中的天體走完整的 apply_black_hole_boundary
+            if b.shred_immunity > 0 or d2 > buf2:
+                b.apply_black_hole_boundary(center, self)
+                if not b.is_active: continue
+                x = b.x; y = b.y
+                ox = x - center; oy = y - center
+                d2 = ox * ox + oy * oy
+            else:
+                b.in_buffer_zone = False
+                if b.tidal_damage > 0:
+                    b.tidal_damage = max(0, b.tidal_damage - 0.005)
+
+            if ccd:
+                sweep[b] = (x0, y0)
+                for gx in range(int(min(x0, x) / cell_size), int(max(x0, x) / cell_size) + 1):
+                    for gy in range(int(min(y0, y) / cell_size), int(max(y0, y) / cell_size) + 1):
+                        key = (gx, gy)
+                        if key not in grid: grid[key] = []
+                        grid[key].append(b)
+            else:
+                key = (int(x / cell_size), int(y / cell_size))
+                if key not in grid: grid[key] = []
+                grid[key].append(b)
 
-        self.absorbed_by_star = main_star.mass - 6000
-        snapshot = self.collect_snapshot()
-        self.epoch_history.append({
-            "ep": self.current_epoch,
-            "sn": snapshot,
-            "sm": round(main_star.mass, 1),
-            "ts": self.total_steps_run
-        })
-        self.current_epoch += 1
+            # 主星在 center：ddx = -ox
+            dsq = d2 + 100.0
+            dd = sqrt(dsq)
+            m = b.mass
+            f = (gm * m) / dsq
+            b.vx += (-ox / dd) * f / m
+            b.vy += (-oy / dd) * f / m
+
+    def sync_thermal(self):
+        """結算所有快轉中的溫度；快照、存檔、普查前呼叫"""
+        now = self.total_steps_run
+        for b in self.bodies:
+            if b.th_until: b.sync_temp(self.pk, now)
+
+    @staticmethod
+    def contact_time(p1, q1, p2, q2, reach):
+        """兩點分別由 p 線性移到 q，回傳距離首次 < reach 的 t∈[0,1]，否則 None"""
+        rx = p1[0] - p2[0]; ry = p1[1] - p2[1]
+        dx = (q1[0] - p1[0]) - (q2[0] - p2[0])
+        dy = (q1[1] - p1[1]) - (q2[1] - p2[1])
+        c = rx * rx + ry * ry - reach * reach
+        if c < 0: return 0.0
+        a = dx * dx + dy * dy
+        if a == 0: return None
+        bh = rx * dx + ry * dy
+        disc = bh * bh - a * c
+        if disc < 0: return None
+        t = (-bh - math.sqrt(disc)) / a
+        return t if 0.0 <= t <= 1.0 else None
+
+    def merge_swept(self, grid, sweep):
+        """連續碰撞：依步內最早接觸時間排序，在接觸點合併，剩餘時間沿合併後的位移前進"""
+        hits = []; seen = set()
+        for cell in grid.values():
+            if len(cell) < 2: continue
+            for i in range(len(cell)):
+                b1 = cell[i]
+                for j in range(i + 1, len(cell)):
+                    b2 = cell[j]
+                    pair = (id(b1), id(b2)) if id(b1) < id(b2) else (id(b2), id(b1))
+                    if pair in seen: continue
+                    seen.add(pair)
+                    t = self.contact_time(sweep[b1], (b1.x, b1.y), sweep[b2], (b2.x, b2.y),
+                                          (b1.radius + b2.radius) * 0.8)
+                    if t is not None: hits.append((t, b1, b2))
+
+        hits.sort(key=lambda h: h[0])
+        for t, b1, b2 in hits:
+            if not b1.is_active or not b2.is_active: continue
+            (x1, y1), (x2, y2) = sweep[b1], sweep[b2]
+            d1x = b1.x - x1; d1y = b1.y - y1
+            d2x = b2.x - x2; d2y = b2.y - y2
+            m1 = b1.mass; m2 = b2.mass
+            b1.x = x1 + d1x * t; b1.y = y1 + d1y * t
+            b2.x = x2 + d2x * t; b2.y = y2 + d2y * t
+            self.merge_bodies(b1, b2)
+            w = b1 if b1.is_active else b2
+            ndx = (d1x * m1 + d2x * m2) / (m1 + m2)
+            ndy = (d1y * m1 + d2y * m2) / (m1 + m2)
+            w.x += ndx * (1 - t); w.y += ndy * (1 - t)
+            sweep[w] = (w.x - ndx, w.y - ndy)
+
+    def get_state(self, with_bodies=True):
+        """完整精度狀態（to_compact 會四捨五入，不能用於重播）；
+        epoch_history 等容器是深複本，之後引擎繼續跑也不會改到它"""
+        st = copy.deepcopy({k: v for k, v in self.__dict__.items()
+                            if k not in ("bodies", "pk", "event_log", "index", "_mem",
+                                         "field_stream")})
+        st["pp"] = self.pk.export_params()
+        st["bodies"] = [dict(b.__dict__, composition=dict(b.composition))
+                        for b in self.bodies if b.is_active] if with_bodies else []
+        return st
+
+    @staticmethod
+    def from_state(st):
+        e = GenesisEngine(st["pp"])
+        for k, v in st.items():
+            if k not in ("pp", "bodies"): setattr(e, k, copy.deepcopy(v))    # 同一份狀態可重建多個引擎
+        e.bodies = []
+        for d in st["bodies"]:
+            b = CelestialBody.__new__(CelestialBody)
+            b.__dict__.update(d)
+            b.composition = dict(d["composition"])
+            e.bodies.append(b)
+        e.index.invalidate()
+        return e
+
+    def log_event(self, kind, b, other=None, m2=0.0, step=None):
+        if not self.event_log: return
+        if step is None: step = self.total_steps_run - 1
+        self.event_log.write(step, kind, b.cid, other.cid if other else 0,
+                             b.mass, m2, b.x, b.y)
 
     def merge_bodies(self, b1, b2):
         if not b1.is_active or not b2.is_active: return
+        now = self.total_steps_run
+        b1.sync_temp(self.pk, now); b2.sync_temp(self.pk, now)
         self.merge_events += 1
         if b1.is_star:
+            self.log_event(EventLog.MERGE, b1, b2, b2.mass)
             b1.mass += b2.mass
             b1.radius = PhysicsKernel.get_radius(b1.mass, b1.spin)
             b2.is_active = False; return
         if b2.is_star:
+            self.log_event(EventLog.MERGE, b2, b1, b1.mass)
             b2.mass += b1.mass
             b2.radius = PhysicsKernel.get_radius(b2.mass, b2.spin)
             b1.is_active = False; return
         w, l = (b1, b2) if b1.mass > b2.mass else (b2, b1)
+        self.log_event(EventLog.MERGE, w, l, l.mass)
         tm = w.mass + l.mass
         w.vx = (w.vx * w.mass + l.vx * l.mass) / tm
         w.vy = (w.vy * w.mass + l.vy * l.mass) / tm
@@ -470,7 +795,7 @@ class GenesisEngine:
             dists.append(d)
             org[b.origin] = org.get(b.origin, 0) + 1
             ke = b.calc_kinetic_energy()
-            pe = b.calc_potential_energy(star)
+            pe = b.calc_potential_energy(star, self.pk)
             if ke + pe < 0: bound_count += 1
             if b.in_buffer_zone: buffer_count += 1
             if d < 700: zones["i"].append(b)
@@ -512,24 +837,109 @@ class GenesisEngine:
         }
 
 
+# ==========================================
+# 3b. 天體索引（cid 查找 + 空間查詢）
+# ==========================================
+class BodyIndex:
+    """cid → 槽位對照，以及目前位置上的網格範圍 / k 近鄰查詢。
+    只在查詢時檢查引擎是否已前進（步數、天體清單），需要時才整個重建，
+    模擬過程本身不付任何維護成本。
+    """
+    def __init__(self, engine, cell_size=100.0):
+        self.engine = engine
+        self.cell = cell_size
+        self.stamp = None
+        self.slots = {}
+        self.grid = {}
+        self.bounds = (0, 0, 0, 0)
+
+    def invalidate(self):
+        self.stamp = None
+
+    def _ensure(self):
+        e = self.engine
+        stamp = (e.total_steps_run, len(e.bodies), id(e.bodies))
+        if stamp == self.stamp: return
+        cs = self.cell
+        slots = {}; grid = {}
+        for i, b in enumerate(e.bodies):
+            if not b.is_active: continue
+            slots[b.cid] = i
+            key = (int(b.x // cs), int(b.y // cs))
+            if key not in grid: grid[key] = []
+            grid[key].append(i)
+        self.slots = slots; self.grid = grid
+        if grid:
+            xs = [k[0] for k in grid]; ys = [k[1] for k in grid]
+            self.bounds = (min(xs), max(xs), min(ys), max(ys))
+        self.stamp = stamp
+
+    def slot(self, cid):
+        self._ensure()
+        return self.slots.get(cid)
+
+    def get(self, cid):
+        i = self.slot(cid)
+        return self.engine.bodies[i] if i is not None else None
+
+    def within(self, x, y, r):
+        """距 (x, y) 不超過 r 的天體 [(dist, body)]，依清單順序（與線性掃描相同）"""
+        self._ensure()
+        cs = self.cell; bodies = self.engine.bodies
+        hits = []
+        for gx in range(int((x - r) // cs), int((x + r) // cs) + 1):
+            for gy in range(int((y - r) // cs), int((y + r) // cs) + 1):
+                for i in self.grid.get((gx, gy), ()):
+                    b = bodies[i]
+                    d = math.hypot(b.x - x, b.y - y)
+                    if d <= r: hits.append((i, d))
+        hits.sort()
+        return [(d, bodies[i]) for i, d in hits]
+
+    def nearest(self, x, y, k=1, exclude=None):
+        """k 近鄰 [(dist, body)]，由近到遠；以同心方環向外擴張"""
+        if k <= 0: return []
+        self._ensure()
+        if not self.grid: return []
+        cs = self.cell; bodies = self.engine.bodies
+        gx = int(x // cs); gy = int(y // cs)
+        x0, x1, y0, y1 = self.bounds
+        max_ring = max(abs(gx - x0), abs(gx - x1), abs(gy - y0), abs(gy - y1))
+        best = []
+        for ring in range(max_ring + 1):
+            for cx in range(gx - ring, gx + ring + 1):
+                edge = (cx == gx - ring or cx == gx + ring)
+                for cy in (range(gy - ring, gy + ring + 1) if edge else (gy - ring, gy + ring)):
+                    for i in self.grid.get((cx, cy), ()):
+                        b = bodies[i]
+                        if b is exclude: continue
+                        best.append((math.hypot(b.x - x, b.y - y), i))
+            # 第 ring+1 圈以外的天體距離至少 ring * cs
+            if len(best) >= k:
+                best.sort()
+                if best[k - 1][0] <= ring * cs: break
+        best.sort()
+        return [(d, bodies[i]) for d, i in best[:k]]
+
+
 # ==========================================
 # 4. 地球物理
 # ==========================================
 class PlanetaryGeophysics:
     @staticmethod
-    def calculate_atmosphere(mass, temp):
+    def calculate_atmosphere(mass, temp, rng=random):
         gh = max(0, mass - 8) / 12.0
         te = max(0.1, 1.0 - (temp / 1500.0))
-        p = gh * te * random.uniform(0.6, 1.4)
+        p = gh * te * rng.uniform(0.6, 1.4)
         comp = {}
         if p < 0.1:
             comp = {"CO2": 0.95, "N2": 0.05}
         elif p > 5.0:
             comp = {"H2": 0.6, "He": 0.3, "Ar": 0.1}
         else:
-            n2 = random.uniform(0.7, 0.8)
-            co2 = random.uniform(0.01, 0.1)
-            o2 = random.uniform(0.05, 0.25) if -5 < temp < 60 else 0.0
+            n2 = rng.uniform(0.7, 0.8)
+            co2 = rng.uniform(0.01, 0.1)
+            o2 = rng.uniform(0.05, 0.25) if -5 < temp < 60 else 0.0
             t = n2 + co2 + o2
             if t > 0:
                 comp = {"N2": round(n2/t, 3), "CO2": round(co2/t, 3), "O2": round(o2/t, 3)}
@@ -538,9 +948,9 @@ class PlanetaryGeophysics:
         return round(p, 3), comp
 
     @staticmethod
-    def analyze_habitability(temp, pressure, mass, volatiles):
+    def analyze_habitability(temp, pressure, mass, volatiles, rng=random):
         wp = (volatiles / mass) * 3.0 if mass > 0 else 0
-        sw = min(100, wp * 100 * random.uniform(0.8, 1.2))
+        sw = min(100, wp * 100 * rng.uniform(0.8, 1.2))
         if pressure < 0.06: bp = -100
         elif pressure > 0: bp = 100.0 * (pressure ** 0.15)
         else: bp = -100
@@ -573,10 +983,10 @@ class DataExtraction:
         return "DP"
 
     @staticmethod
-    def compact_planet(target, star, dist):
-        p, a = PlanetaryGeophysics.calculate_atmosphere(target.mass, target.temp)
+    def compact_planet(target, star, dist, rng=random):
+        p, a = PlanetaryGeophysics.calculate_atmosphere(target.mass, target.temp, rng)
         h = PlanetaryGeophysics.analyze_habitability(
-            target.temp, p, target.mass, target.composition['Vo']
+            target.temp, p, target.mass, target.composition['Vo'], rng
         )
         return {
             "id": target.cid, "tp": DataExtraction.classify(target.mass),
@@ -595,6 +1005,9 @@ class DataExtraction:
 SAVE_DIR = "universe_saves"
 SAVE_FILE = os.path.join(SAVE_DIR, "state.json")
 REPORT_FILE = os.path.join(SAVE_DIR, "report_summary.json")
+EVENT_FILE = os.path.join(SAVE_DIR, "events.bin")
+CKPT_DIR = os.path.join(SAVE_DIR, "ckpt")
+FIELD_FILE = os.path.join(SAVE_DIR, "fields.bin")
 
 class SaveManager:
     @staticmethod
@@ -616,3 +1029,634 @@ class SaveManager:
             if c.get("type") == "ENGINE": return c["data"]
         return None
 
+
+
+# ==========================================
+# 7. 事件流（合併 / 撕碎 / 注入）與重播
+# ==========================================
+class EventLog:
+    """只追加的定寬二進位事件流，外加稀疏的完整精度檢查點。
+
+    事件檔：每筆 32 bytes = step, kind, cid, cid2, m, m2, x, y（依 step 遞增）。
+    檢查點檔（path + ".ckpt"）：每幀 = step(uint32) + 長度(uint32) + pickle，
+    含引擎狀態（不含 epoch_history）與亂數狀態，因此 seek 只需從最近的檢查點
+    往前跑幾步。只保留最近 keep 幀；以 at_step 重新開啟時，先截掉該步
+    （含）之後的事件與檢查點，續跑追加的 step 才會保持遞增。
+    """
+    REC = struct.Struct('<IB3xiiffff')
+    HDR = struct.Struct('<II')
+    MERGE = 1; SHRED_PARTIAL = 2; SHRED_COMPLETE = 3; FRAGMENT = 4; INJECT = 5
+    NAMES = {1: "merge", 2: "shred_partial", 3: "shred_complete",
+             4: "fragment", 5: "inject"}
+
+    def __init__(self, path, checkpoint_every=600, keep=4, at_step=None):
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        self.keep = keep
+        if at_step is not None: EventLog.truncate(path, at_step)
+        self.frames = len(EventLog.checkpoints(path)) if os.path.exists(path + ".ckpt") else 0
+        self.last = None                # 本次開啟後最近一幀的 step
+        self.f = open(path, 'ab')
+        self.cf = open(path + ".ckpt", 'ab')
+
+    def write(self, step, kind, cid, cid2, m, m2, x, y):
+        self.f.write(self.REC.pack(step, kind, cid, cid2, m, m2, x, y))
+
+    def due(self, step):
+        """開啟後的第一步必定打點（續跑前的幀可能來自較舊的存檔），之後每 checkpoint_every 步"""
+        return self.last is None or step - self.last >= self.checkpoint_every
+
+    def checkpoint(self, engine):
+        st = engine.get_state()
+        st["epoch_history"] = []       # 重播用不到，且會隨 epoch 無限成長
+        blob = pickle.dumps((st, random.getstate()), protocol=pickle.HIGHEST_PROTOCOL)
+        self.cf.write(self.HDR.pack(engine.total_steps_run, len(blob)))
+        self.cf.write(blob)
+        self.last = engine.total_steps_run
+        self.frames += 1
+        self.flush()
+        if self.frames > self.keep: self._prune()
+
+    def _prune(self):
+        """檢查點檔只留最近 keep 幀（事件檔保留全部）"""
+        cp = self.path + ".ckpt"
+        self.cf.close()
+        start = EventLog.checkpoints(self.path)[-self.keep][1] - self.HDR.size
+        with open(cp, 'rb') as f:
+            f.seek(start); tail = f.read()
+        with open(cp + ".tmp", 'wb') as f: f.write(tail)
+        os.replace(cp + ".tmp", cp)
+        self.frames = self.keep
+        self.cf = open(cp, 'ab')
+
+    def flush(self):
+        self.f.flush(); self.cf.flush()
+
+    def close(self):
+        self.f.close(); self.cf.close()
+
+    @staticmethod
+    def _lower_bound(f, n, step):
+        """第一筆 step >= 給定值的記錄索引"""
+        rs = EventLog.REC.size
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            f.seek(mid * rs)
+            if EventLog.REC.unpack(f.read(rs))[0] < step: lo = mid + 1
+            else: hi = mid
+        return lo
+
+    @staticmethod
+    def truncate(path, step):
+        """丟掉 step（含）之後的事件與檢查點"""
+        rs = EventLog.REC.size
+        if os.path.exists(path):
+            with open(path, 'r+b') as f:
+                f.seek(0, 2)
+                f.truncate(EventLog._lower_bound(f, f.tell() // rs, step) * rs)
+        if os.path.exists(path + ".ckpt"):
+            cut = [off - EventLog.HDR.size for s, off in EventLog.checkpoints(path) if s >= step]
+            if cut:
+                with open(path + ".ckpt", 'r+b') as f: f.truncate(cut[0])
+
+    @staticmethod
+    def read(path, start=0, end=None):
+        """讀取 start <= step < end 的事件；以二分搜尋定位，不掃描整個檔"""
+        rs = EventLog.REC.size
+        with open(path, 'rb') as f:
+            f.seek(0, 2)
+            n = f.tell() // rs
+            lo = EventLog._lower_bound(f, n, start) if start else 0
+            hi = n if end is None else EventLog._lower_bound(f, n, end)
+            f.seek(lo * rs)
+            buf = f.read((hi - lo) * rs)
+        out = []
+        for step, kind, cid, cid2, m, m2, x, y in EventLog.REC.iter_unpack(buf):
+            out.append({"s": step, "k": EventLog.NAMES.get(kind, kind),
+                        "c": cid, "c2": cid2, "m": m, "m2": m2, "x": x, "y": y})
+        return out
+
+    @staticmethod
+    def checkpoints(path):
+        """[(step, offset)]，只讀表頭"""
+        out = []
+        with open(path + ".ckpt", 'rb') as f:
+            while True:
+                head = f.read(EventLog.HDR.size)
+                if len(head) < EventLog.HDR.size: break
+                step, size = EventLog.HDR.unpack(head)
+                out.append((step, f.tell()))
+                f.seek(size, 1)
+        return out
+
+    @staticmethod
+    def seek(path, step):
+        """重建第 step 步開始前的引擎：最近檢查點 + 逐步重播（epoch_history 為空）"""
+        cps = [c for c in EventLog.checkpoints(path) if c[0] <= step]
+        if not cps: return None
+        _, off = cps[-1]
+        with open(path + ".ckpt", 'rb') as f:
+            f.seek(off)
+            st, rng = pickle.load(f)
+        caller_rng = random.getstate()
+        engine = GenesisEngine.from_state(st)
+        random.setstate(rng)
+        while engine.total_steps_run < step:
+            engine.step()
+        random.setstate(caller_rng)
+        return engine
+
+
+# ==========================================
+# 8. 參數掃描（多宇宙驅動）
+# ==========================================
+class SweepEngine:
+    """多宇宙驅動：每組參數一個 GenesisEngine，逐個推進。
+    只是迴圈包裝，沒有批次加速；成本等於分別跑每個宇宙。
+    """
+    def __init__(self, param_sets):
+        self.engines = [GenesisEngine(p) for p in param_sets]
+        self.n_uni = len(self.engines)
+        self.current_epoch = 0
+        self.frozen = [0] * self.n_uni      # 已收斂的宇宙不再推進
+
+    @staticmethod
+    def param_grid(base=None, **axes):
+        """笛卡兒積：param_grid(BS=[0.7, 0.78], TS=[0.9, 0.95])"""
+        keys = list(axes)
+        out = []
+        for combo in itertools.product(*(axes[k] for k in keys)):
+            p = dict(base or {})
+            p.update(zip(keys, combo))
+            out.append(p)
+        return out
+
+    @property
+    def kernels(self): return [e.pk for e in self.engines]
+
+    @property
+    def run_ids(self): return [e.run_id for e in self.engines]
+
+    @property
+    def epoch_history(self): return [e.epoch_history for e in self.engines]
+
+    @property
+    def merge_events(self): return [e.merge_events for e in self.engines]
+
+    def big_bang(self, n_particles, seed=None):
+        """seed 固定時，每個宇宙從相同初始條件出發，只有參數不同；不擾動全域亂數流"""
+        for e in self.engines:
+            if seed is None:
+                e.big_bang(n_particles); continue
+            state = random.getstate()
+            random.seed(seed)
+            e.big_bang(n_particles)
+            random.setstate(state)
+
+    def freeze(self, u):
+        """停止推進第 u 個宇宙；引擎保留，universe(u) 仍是最後狀態"""
+        self.frozen[u] = 1
+
+    def run_epoch(self, steps):
+        for u, e in enumerate(self.engines):
+            if not self.frozen[u]: e.run_epoch(steps)
+        self.current_epoch += 1
+
+    def universe(self, u):
+        """第 u 個宇宙的引擎本身，可直接交給驗證器與報告"""
+        return self.engines[u]
+
+    def summary(self):
+        """每個宇宙的參數與最新快照"""
+        out = []
+        for e in self.engines:
+            h = e.epoch_history
+            out.append({"pp": e.pk.export_params(), "sn": h[-1]["sn"] if h else {}})
+        return out
+
+
+# ==========================================
+# 9. 低精度儲存（float32 欄位）
+# ==========================================
+ORIGINS = ("bigbang", "injected", "recycled")
+
+
+class CompactStore:
+    """把引擎天體壓成 float32 欄位：位置存相對 center_pos 的偏移，
+    旗標與來源壓進一個 byte。每個天體約 64 bytes（物件版約 1 KB），
+    百萬天體約 64 MB，可讓許多停放中的宇宙同時留在記憶體。
+    """
+    COLS_F = ("rx", "ry", "vx", "vy", "mass", "spin", "temp", "radius",
+              "tidal", "fe", "si", "vo", "tilt", "bdist")
+    F_STAR = 1; F_ACTIVE = 2; F_BUF = 4; ORIGIN_SHIFT = 3
+
+    def __init__(self, center=5000):
+        self.center = center
+        for c in self.COLS_F: setattr(self, c, array('f'))
+        self.cid = array('i')
+        self.hits = array('H')
+        self.immune = array('B')
+        self.flags = array('B')
+        self.meta = {}
+
+    def __len__(self):
+        return len(self.cid)
+
+    def append(self, b):
+        c = self.center
+        self.rx.append(b.x - c); self.ry.append(b.y - c)
+        self.vx.append(b.vx); self.vy.append(b.vy)
+        self.mass.append(b.mass); self.spin.append(b.spin)
+        self.temp.append(b.temp); self.radius.append(b.radius)
+        self.tidal.append(b.tidal_damage)
+        self.fe.append(b.composition["Fe"]); self.si.append(b.composition["Si"])
+        self.vo.append(b.composition["Vo"])
+        self.tilt.append(b.axial_tilt); self.bdist.append(b.birth_dist)
+        self.cid.append(b.cid)
+        self.hits.append(min(b.boundary_hits, 0xFFFF))
+        self.immune.append(min(b.shred_immunity, 0xFF))
+        self.flags.append(
+            (self.F_STAR if b.is_star else 0) |
+            (self.F_ACTIVE if b.is_active else 0) |
+            (self.F_BUF if b.in_buffer_zone else 0) |
+            (ORIGINS.index(b.origin) << self.ORIGIN_SHIFT))
+
+    def body(self, i):
+        """還原成 CelestialBody（不消耗亂數）"""
+        b = CelestialBody.__new__(CelestialBody)
+        fl = self.flags[i]
+        b.x = self.rx[i] + self.center; b.y = self.ry[i] + self.center
+        b.vx = self.vx[i]; b.vy = self.vy[i]
+        b.mass = self.mass[i]; b.spin = self.spin[i]; b.temp = self.temp[i]
+        b.radius = self.radius[i]
+        b.cid = self.cid[i]
+        b.composition = {"Fe": self.fe[i], "Si": self.si[i], "Vo": self.vo[i]}
+        b.axial_tilt = self.tilt[i]
+        b.is_star = bool(fl & self.F_STAR); b.is_active = bool(fl & self.F_ACTIVE)
+        b.birth_dist = self.bdist[i]
+        b.boundary_hits = self.hits[i]
+        b.origin = ORIGINS[fl >> self.ORIGIN_SHIFT]
+        b.in_buffer_zone = bool(fl & self.F_BUF)
+        b.tidal_damage = self.tidal[i]
+        b.shred_immunity = self.immune[i]
+        b.th_until = 0; b.th_s = 0; b.th_d2 = 0.0; b.th_q = 0.0
+        return b
+
+    @staticmethod
+    def from_engine(engine):
+        st = CompactStore(engine.center_pos)
+        engine.sync_thermal()
+        st.meta = engine.get_state(with_bodies=False)
+        for b in engine.bodies:
+            if b.is_active: st.append(b)
+        return st
+
+    def to_engine(self):
+        state = random.getstate()   # 還原不可擾動模擬的亂數流
+        e = GenesisEngine.from_state(self.meta)
+        random.setstate(state)
+        e.bodies = [self.body(i) for i in range(len(self))]
+        e.index.invalidate()
+        return e
+
+    def nbytes(self):
+        cols = [getattr(self, c) for c in self.COLS_F] + [
+            self.cid, self.hits, self.immune, self.flags]
+        return sum(a.itemsize * len(a) for a in cols)
+
+
+# ==========================================
+# 10. 增量存檔（關鍵幀 + 差分）
+# ==========================================
+class DeltaCheckpointer:
+    """每個 epoch 都能存檔的壓縮檢查點。
+
+    天體量化成 int32 欄位（精度與 to_compact 的四捨五入相同）。關鍵幀
+    存完整欄位；差分只存相對最近關鍵幀新增、消失、改變的天體：
+    改變者存欄位差值（旗標用 XOR），cid 一律差分編碼，整塊再壓縮。
+    差分都只依賴關鍵幀，所以載入 = 最新關鍵幀 + 最新一個差分。
+    """
+    MAGIC_KF = b"V6KF"; MAGIC_DL = b"V6DL"
+    HDR = struct.Struct('<4sBII')     # magic, codec, seq, base_seq
+    CODECS = {0: "zlib", 1: "lzma"}  # lzma 只在用到時載入
+    # (欄位, 量化倍率)；x/y 相對 center_pos
+    QCOLS = (("x", 10), ("y", 10), ("vx", 1000), ("vy", 1000), ("mass", 100),
+             ("spin", 100), ("temp", 10), ("tidal_damage", 1000),
+             ("Fe", 10), ("Si", 10), ("Vo", 10), ("axial_tilt", 10), ("birth_dist", 1))
+    NCOL = len(QCOLS) + 3             # + boundary_hits, shred_immunity, flags
+
+    def __init__(self, path=CKPT_DIR, keyframe_every=10, codec="zlib"):
+        self.path = path
+        self.keyframe_every = keyframe_every
+        self.codec = 1 if codec == "lzma" else 0
+        self.seq = 0                  # 續跑時接在既有檔案之後，第一次存檔必為關鍵幀
+        if os.path.exists(path):
+            seqs = [int(n[3:9]) for n in os.listdir(path)
+                    if n.endswith(".bin") and n[:3] in ("kf_", "dl_")]
+            self.seq = max(seqs, default=0)
+        self.base = None              # 關鍵幀：cid -> 量化列
+        self.base_seq = 0
+        self.since_kf = 0
+
+    # ---- 量化 ----
+    @staticmethod
+    def quantize(b, center):
+        comp = b.composition
+        vals = (b.x - center, b.y - center, b.vx, b.vy, b.mass, b.spin, b.temp,
+                b.tidal_damage, comp["Fe"], comp["Si"], comp["Vo"], b.axial_tilt,
+                b.birth_dist)
+        row = [int(round(v * q)) for v, (_, q) in zip(vals, DeltaCheckpointer.QCOLS)]
+        row.append(min(b.boundary_hits, 0x7FFFFFFF))
+        row.append(b.shred_immunity)
+        row.append((1 if b.is_star else 0) | (2 if b.in_buffer_zone else 0) |
+                   (ORIGINS.index(b.origin) << 2))
+        return tuple(row)
+
+    @staticmethod
+    def dequantize(cid, row, center):
+        q = [v / s for v, (_, s) in zip(row, DeltaCheckpointer.QCOLS)]
+        b = CelestialBody.__new__(CelestialBody)
+        b.cid = cid
+        b.x = q[0] + center; b.y = q[1] + center
+        b.vx = q[2]; b.vy = q[3]
+        b.mass = q[4]; b.spin = q[5]; b.temp = q[6]; b.tidal_damage = q[7]
+        b.composition = {"Fe": q[8], "Si": q[9], "Vo": q[10]}
+        b.axial_tilt = q[11]; b.birth_dist = q[12]
+        b.radius = PhysicsKernel.get_radius(b.mass, b.spin)
+        b.boundary_hits = row[-3]; b.shred_immunity = row[-2]
+        fl = row[-1]
+        b.is_star = bool(fl & 1); b.in_buffer_zone = bool(fl & 2)
+        b.origin = ORIGINS[fl >> 2]
+        b.is_active = True
+        b.th_until = 0; b.th_s = 0; b.th_d2 = 0.0; b.th_q = 0.0
+        return b
+
+    # ---- 欄位區塊 ----
+    @staticmethod
+    def _cid_block(cids):
+        out = array('i'); prev = 0
+        for c in cids:
+            out.append(c - prev); prev = c
+        return out.tobytes()
+
+    @staticmethod
+    def _read_cids(buf):
+        a = array('i'); a.frombytes(buf)
+        out = []; prev = 0
+        for d in a:
+            prev += d; out.append(prev)
+        return out
+
+    @staticmethod
+    def _col_blocks(rows):
+        """按欄存放（同欄數值相近，壓縮率遠高於按列）"""
+        return [array('i', [r[k] for r in rows]).tobytes()
+                for k in range(DeltaCheckpointer.NCOL)]
+
+    @staticmethod
+    def _read_rows(blocks, n):
+        cols = []
+        for buf in blocks:
+            a = array('i'); a.frombytes(buf); cols.append(a)
+        return [tuple(c[i] for c in cols) for i in range(n)]
+
+    @staticmethod
+    def _pack(blocks):
+        return b"".join(struct.pack('<I', len(x)) + x for x in blocks)
+
+    @staticmethod
+    def _unpack(buf):
+        out = []; off = 0
+        while off < len(buf):
+            (n,) = struct.unpack_from('<I', buf, off); off += 4
+            out.append(buf[off:off + n]); off += n
+        return out
+
+    # ---- 存檔 ----
+    def save(self, engine, tallies=None):
+        """回傳 (種類, 位元組數)；tallies 是呼叫端的統計（JSON 可序列化），隨中繼資料一起存"""
+        engine.sync_thermal()
+        center = engine.center_pos
+        live = [b for b in engine.bodies if b.is_active]
+        cur = {b.cid: self.quantize(b, center) for b in live}
+        st = engine.get_state(with_bodies=False)
+        if tallies is not None: st["tallies"] = tallies
+        meta = json.dumps(st, separators=(',', ':')).encode()
+        self.seq += 1
+        kf = self.base is None or self.since_kf >= self.keyframe_every
+        if kf:
+            cids = [b.cid for b in live]
+            blocks = [meta, self._cid_block(cids)] + self._col_blocks([cur[c] for c in cids])
+            magic = self.MAGIC_KF
+            self.base = cur; self.base_seq = self.seq; self.since_kf = 0
+        else:
+            base = self.base
+            gone = [c for c in base if c not in cur]
+            new = [b.cid for b in live if b.cid not in base]
+            changed = [c for c in cur if c in base and cur[c] != base[c]]
+            diff = [tuple(a - b for a, b in zip(cur[c][:-1], base[c][:-1])) +
+                    (cur[c][-1] ^ base[c][-1],) for c in changed]
+            blocks = ([meta, self._cid_block(gone), self._cid_block(new),
+                       self._cid_block(changed)] +
+                      self._col_blocks([cur[c] for c in new]) + self._col_blocks(diff))
+            magic = self.MAGIC_DL
+            self.since_kf += 1
+
+        comp = self._codec(self.codec).compress
+        data = self.HDR.pack(magic, self.codec, self.seq, self.base_seq) + comp(self._pack(blocks))
+        if not os.path.exists(self.path): os.makedirs(self.path)
+        name = ("kf_%06d.bin" if kf else "dl_%06d.bin") % self.seq
+        tmp = os.path.join(self.path, name + ".tmp")
+        with open(tmp, 'wb') as f: f.write(data)
+        os.replace(tmp, os.path.join(self.path, name))
+        if kf: self._prune()
+        return ("KEY" if kf else "DELTA"), len(data)
+
+    def _prune(self):
+        """只保留目前與前一組（關鍵幀 + 其差分）"""
+        kfs = sorted(n for n in os.listdir(self.path) if n.startswith("kf_"))
+        if len(kfs) < 2: return
+        keep_from = int(kfs[-2][3:9])
+        for n in os.listdir(self.path):
+            if n.endswith(".bin") and int(n[3:9]) < keep_from:
+                os.remove(os.path.join(self.path, n))
+
+    # ---- 載入 ----
+    @staticmethod
+    def _codec(codec):
+        return __import__(DeltaCheckpointer.CODECS[codec])
+
+    @staticmethod
+    def _read(path):
+        with open(path, 'rb') as f: data = f.read()
+        magic, codec, seq, base_seq = DeltaCheckpointer.HDR.unpack_from(data)
+        raw = DeltaCheckpointer._codec(codec).decompress(data[DeltaCheckpointer.HDR.size:])
+        return magic, seq, base_seq, DeltaCheckpointer._unpack(raw)
+
+    @staticmethod
+    def _latest(path):
+        if not os.path.exists(path): return None
+        files = sorted((int(n[3:9]), n) for n in os.listdir(path)
+                       if n.endswith(".bin") and n[:3] in ("kf_", "dl_"))
+        return os.path.join(path, files[-1][1]) if files else None
+
+    @staticmethod
+    def peek(path=CKPT_DIR):
+        """只讀最新檢查點的表頭與引擎中繼資料，不重建天體；沒有檢查點時回傳 None"""
+        fn = DeltaCheckpointer._latest(path)
+        if fn is None: return None
+        magic, seq, base_seq, blocks = DeltaCheckpointer._read(fn)
+        st = json.loads(blocks[0])
+        return {"seq": seq, "kind": "KEY" if magic == DeltaCheckpointer.MAGIC_KF else "DELTA",
+                "base": base_seq, "bytes": os.path.getsize(fn),
+                "epoch": st.get("current_epoch", 0), "steps": st.get("total_steps_run", 0),
+                "rid": st.get("run_id"), "tallies": st.get("tallies")}
+
+    @staticmethod
+    def load(path=CKPT_DIR):
+        """由最新關鍵幀 + 最新差分重建引擎；沒有檢查點時回傳 None"""
+        fn = DeltaCheckpointer._latest(path)
+        if fn is None: return None
+        magic, seq, base_seq, blocks = DeltaCheckpointer._read(fn)
+        if magic == DeltaCheckpointer.MAGIC_DL:
+            delta = blocks
+            _, _, _, blocks = DeltaCheckpointer._read(os.path.join(path, "kf_%06d.bin" % base_seq))
+        else:
+            delta = None
+
+        nc = DeltaCheckpointer.NCOL
+        cids = DeltaCheckpointer._read_cids(blocks[1])
+        rows = dict(zip(cids, DeltaCheckpointer._read_rows(blocks[2:2 + nc], len(cids))))
+        meta = blocks[0]
+        if delta:
+            meta = delta[0]
+            gone = set(DeltaCheckpointer._read_cids(delta[1]))
+            new = DeltaCheckpointer._read_cids(delta[2])
+            changed = DeltaCheckpointer._read_cids(delta[3])
+            new_rows = DeltaCheckpointer._read_rows(delta[4:4 + nc], len(new))
+            diffs = DeltaCheckpointer._read_rows(delta[4 + nc:4 + 2 * nc], len(changed))
+            for c, d in zip(changed, diffs):
+                base = rows[c]
+                rows[c] = tuple(a + b for a, b in zip(base[:-1], d[:-1])) + (base[-1] ^ d[-1],)
+            cids = [c for c in cids if c not in gone] + new
+            rows.update(zip(new, new_rows))
+
+        st = json.loads(meta)
+        st.pop("tallies", None)
+        state = random.getstate()
+        e = GenesisEngine.from_state(dict(st, bodies=[]))
+        random.setstate(state)
+        e.bodies = [DeltaCheckpointer.dequantize(c, rows[c], e.center_pos) for c in cids]
+        e.index.invalidate()
+        return e
+
+
+# ==========================================
+# 11. 密度場與徑向剖面輸出
+# ==========================================
+class FieldStream:
+    """每 every 步把活躍天體（不含主星）分箱成固定大小的場，追加到二進位檔。
+
+    每幀 = 表頭 + float32 區塊：
+      2D（res x res，覆蓋 center ± R）：數量、質量、平均溫度
+      徑向（nr 箱）：數量、質量、平均溫度、平均潮汐損傷
+      分區總計（內部 / 緩衝帶 / 撕碎區）：數量、質量
+    徑向箱的一半放在 BOUNDARY_START 以內，另一半細分緩衝帶與撕碎區，
+    邊界恰好落在箱界上。幀大小只取決於解析度，與天體數量無關。
+    """
+    MAGIC = b"V6FD"
+    HDR = struct.Struct('<4sIIHHfff')   # magic, epoch, step, res, nr, R, BS, TS
+
+    def __init__(self, path, res=64, nr=32, every=300):
+        self.path = path
+        self.res = res; self.nr = nr; self.every = every
+        self.f = open(path, 'ab')
+
+    @staticmethod
+    def radial_edges(R, bs, ts, nr):
+        n_in = nr // 2
+        n_shred = max(2, (nr - n_in) // 4)
+        n_buf = nr - n_in - n_shred
+        edges = [R * bs * i / n_in for i in range(n_in)]
+        edges += [R * (bs + (ts - bs) * i / n_buf) for i in range(n_buf)]
+        edges += [R * (ts + (1.0 - ts) * i / n_shred) for i in range(n_shred + 1)]
+        return edges
+
+    @staticmethod
+    def frame_size(res, nr):
+        return FieldStream.HDR.size + 4 * (3 * res * res + 4 * nr + (nr + 1) + 6)
+
+    def bin(self, engine):
+        """回傳 (edges, 2D 欄位, 徑向欄位, 分區總計)"""
+        pk = engine.pk; res = self.res; nr = self.nr
+        R = pk.UNIVERSE_RADIUS; c = engine.center_pos
+        active = [b for b in engine.bodies if b.is_active and not b.is_star]
+        xs = [b.x - c for b in active]; ys = [b.y - c for b in active]
+        ms = [b.mass for b in active]; ts = [b.temp for b in active]
+        tds = [b.tidal_damage for b in active]
+
+        scale = res / (2.0 * R); hi = res - 1
+        cells = [min(hi, max(0, int((y + R) * scale))) * res +
+                 min(hi, max(0, int((x + R) * scale))) for x, y in zip(xs, ys)]
+        n2 = array('f', bytes(4 * res * res)); m2 = array('f', n2); t2 = array('f', n2)
+        for k, m, t in zip(cells, ms, ts):
+            n2[k] += 1; m2[k] += m; t2[k] += t
+
+        edges = self.radial_edges(R, pk.BOUNDARY_START, pk.TIDAL_SHRED_THRESHOLD, nr)
+        rbin = [min(nr - 1, bisect.bisect_right(edges, math.hypot(x, y)) - 1)
+                for x, y in zip(xs, ys)]
+        nr_ = array('f', bytes(4 * nr)); mr = array('f', nr_); tr = array('f', nr_); dr = array('f', nr_)
+        for k, m, t, td in zip(rbin, ms, ts, tds):
+            nr_[k] += 1; mr[k] += m; tr[k] += t; dr[k] += td
+        for k in range(res * res):
+            if n2[k]: t2[k] /= n2[k]
+        for k in range(nr):
+            if nr_[k]: tr[k] /= nr_[k]; dr[k] /= nr_[k]
+
+        n_in = nr // 2; n_sh = max(2, (nr - n_in) // 4)
+        zones = array('f')
+        for lo, hi_ in ((0, n_in), (n_in, nr - n_sh), (nr - n_sh, nr)):
+            zones.append(sum(nr_[lo:hi_])); zones.append(sum(mr[lo:hi_]))
+        return array('f', edges), (n2, m2, t2), (nr_, mr, tr, dr), zones
+
+    def write(self, engine):
+        engine.sync_thermal()
+        edges, grid, radial, zones = self.bin(engine)
+        pk = engine.pk
+        self.f.write(self.HDR.pack(self.MAGIC, engine.current_epoch, engine.total_steps_run,
+                                   self.res, self.nr, pk.UNIVERSE_RADIUS,
+                                   pk.BOUNDARY_START, pk.TIDAL_SHRED_THRESHOLD))
+        for a in grid + radial: self.f.write(a.tobytes())
+        self.f.write(edges.tobytes()); self.f.write(zones.tobytes())
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+    @staticmethod
+    def read(path, index=None):
+        """逐幀讀取；index 指定時直接跳到第 index 幀（定寬，不需掃描）"""
+        with open(path, 'rb') as f:
+            head = f.read(FieldStream.HDR.size)
+            if len(head) < FieldStream.HDR.size: return
+            res, nr = FieldStream.HDR.unpack(head)[3:5]
+            size = FieldStream.frame_size(res, nr)
+            f.seek(size * index if index else 0)
+            while True:
+                buf = f.read(size)
+                if len(buf) < size: return
+                magic, ep, step, res, nr, R, bs, ts = FieldStream.HDR.unpack_from(buf)
+                a = array('f'); a.frombytes(buf[FieldStream.HDR.size:])
+                g = res * res; o = 3 * g
+                yield {
+                    "ep": ep, "s": step, "res": res, "R": R, "bs": bs, "ts": ts,
+                    "count": a[0:g], "mass": a[g:2 * g], "temp": a[2 * g:o],
+                    "r_count": a[o:o + nr], "r_mass": a[o + nr:o + 2 * nr],
+                    "r_temp": a[o + 2 * nr:o + 3 * nr], "r_tidal": a[o + 3 * nr:o + 4 * nr],
+                    "edges": a[o + 4 * nr:o + 5 * nr + 1],
+                    "zones": {"inner": tuple(a[o + 5 * nr + 1:o + 5 * nr + 3]),
+                              "buffer": tuple(a[o + 5 * nr + 3:o + 5 * nr + 5]),
+                              "shred": tuple(a[o + 5 * nr + 5:o + 5 * nr + 7])}
+                }
+                if index is not None: return
@@ -7,8 +7,9 @@ import os
 
 from c import (
     PhysicsKernel, CelestialBody, GenesisEngine,
-    PlanetaryGeophysics, DataExtraction, SaveManager,
-    SAVE_DIR, SAVE_FILE, REPORT_FILE
+    PlanetaryGeophysics, DataExtraction, SaveManager, EventLog, CompactStore,
+    DeltaCheckpointer, FieldStream,
+    SAVE_DIR, SAVE_FILE, REPORT_FILE, EVENT_FILE, CKPT_DIR, FIELD_FILE
 )
 
 SV_FILE = os.path.join(SAVE_DIR, "spherical_verification.json")
@@ -18,6 +19,50 @@ SV_FILE = os.path.join(SAVE_DIR, "spherical_verification.json")
 # 1. 球形宇宙驗證（年輕膨脹 + 黑洞邊界）
 # ==========================================
 class SphericalUniverseVerifier:
+    R4={"IMPROVING":"CONFIRMED","STABLE":"STABLE","UNKNOWN":"NOT_YET"}
+    R5={"DECELERATING":"CLOSED","ACCELERATING":"DARK_E","STEADY":"STABLE"}
+    R7={"TIGHTENING":"MATURING","STABLE":"STABLE","LOOSENING":"DISPERSING"}
+
+    @staticmethod
+    def uni_trend(history):
+        uni_trend=[{"ep":h["ep"],"uni":h["sn"].get("uni")} for h in history if h.get("sn",{}).get("uni") is not None]
+        trend="UNKNOWN"
+        if len(uni_trend)>=2:
+            half=len(uni_trend)//2
+            a1=sum(x["uni"] for x in uni_trend[:half])/max(half,1)
+            a2=sum(x["uni"] for x in uni_trend[half:])/max(len(uni_trend)-half,1)
+            d=a2-a1
+            trend="IMPROVING" if d>0.03 else "DEGRADING" if d<-0.03 else "STABLE"
+        return uni_trend,trend
+
+    @staticmethod
+    def expansion(history):
+        dt=[{"ep":h["ep"],"d":h["sn"].get("avg_d")} for h in history if h.get("sn",{}).get("avg_d") is not None]
+        exp="UNKNOWN"; rates=[]
+        if len(dt)>=3:
+            rates=[round(dt[i]["d"]-dt[i-1]["d"],2) for i in range(1,len(dt))]
+            if len(rates)>=2:
+                h2=len(rates)//2
+                e_r=sum(rates[:h2])/h2; l_r=sum(rates[h2:])/max(len(rates)-h2,1)
+                exp="DECELERATING" if l_r<e_r-1 else "ACCELERATING" if l_r>e_r+1 else "STEADY"
+        return dt,rates,exp
+
+    @staticmethod
+    def binding_evo(history):
+        bt=[{"ep":h["ep"],"pct":h["sn"].get("bound_pct")} for h in history if h.get("sn",{}).get("bound_pct") is not None]
+        evo="UNKNOWN"
+        if len(bt)>=2:
+            d2=bt[-1]["pct"]-bt[0]["pct"]
+            evo="TIGHTENING" if d2>2 else "LOOSENING" if d2<-2 else "STABLE"
+        return bt,evo
+
+    @staticmethod
+    def trend_verdicts(history):
+        """只看 epoch_history 的 T4/T5/T7 判定，不走訪天體"""
+        V=SphericalUniverseVerifier
+        return {"T4":V.R4.get(V.uni_trend(history)[1],"UNEXPECTED"),
+                "T5":V.R5.get(V.expansion(history)[2],"NEED_MORE"),
+                "T7":V.R7.get(V.binding_evo(history)[1],"NEED_MORE")}
 
     @staticmethod
     def analyze(engine):
@@ -31,7 +76,7 @@ class SphericalUniverseVerifier:
         # T1: 重力束縛度
         bound=0; energies=[]
         for b in active:
-            te = b.calc_kinetic_energy() + b.calc_potential_energy(star)
+            te = b.calc_kinetic_energy() + b.calc_potential_energy(star, engine.pk)
             energies.append(te)
             if te < 0: bound += 1
         bp = round(bound/len(active)*100, 1)
@@ -73,14 +118,7 @@ class SphericalUniverseVerifier:
         }
 
         # T4: 均勻化趨勢
-        uni_trend=[{"ep":h["ep"],"uni":h["sn"].get("uni")} for h in history if h.get("sn",{}).get("uni") is not None]
-        trend="UNKNOWN"
-        if len(uni_trend)>=2:
-            half=len(uni_trend)//2
-            a1=sum(x["uni"] for x in uni_trend[:half])/max(half,1)
-            a2=sum(x["uni"] for x in uni_trend[half:])/max(len(uni_trend)-half,1)
-            d=a2-a1
-            trend="IMPROVING" if d>0.03 else "DEGRADING" if d<-0.03 else "STABLE"
+        uni_trend,trend=SphericalUniverseVerifier.uni_trend(history)
         abins=[0]*8
         for b in active:
             ang=math.atan2(b.y-star.y,b.x-star.x)+math.pi
@@ -90,21 +128,14 @@ class SphericalUniverseVerifier:
         results["T4"] = {
             "l":"均勻化趨勢","cur":cur_uni,"bins":abins,
             "trend_data":uni_trend,"trend":trend,
-            "r":"CONFIRMED" if trend=="IMPROVING" else "STABLE" if trend=="STABLE" else "NOT_YET" if trend=="UNKNOWN" else "UNEXPECTED"
+            "r":SphericalUniverseVerifier.R4.get(trend,"UNEXPECTED")
         }
 
         # T5: 膨脹動力學
-        dt=[{"ep":h["ep"],"d":h["sn"].get("avg_d")} for h in history if h.get("sn",{}).get("avg_d") is not None]
-        exp="UNKNOWN"; rates=[]
-        if len(dt)>=3:
-            rates=[round(dt[i]["d"]-dt[i-1]["d"],2) for i in range(1,len(dt))]
-            if len(rates)>=2:
-                h2=len(rates)//2
-                e_r=sum(rates[:h2])/h2; l_r=sum(rates[h2:])/max(len(rates)-h2,1)
-                exp="DECELERATING" if l_r<e_r-1 else "ACCELERATING" if l_r>e_r+1 else "STEADY"
+        dt,rates,exp=SphericalUniverseVerifier.expansion(history)
         results["T5"] = {
             "l":"膨脹動力學","data":dt,"rates":rates,"type":exp,
-            "r":"CLOSED" if exp=="DECELERATING" else "DARK_E" if exp=="ACCELERATING" else "STABLE" if exp=="STEADY" else "NEED_MORE"
+            "r":SphericalUniverseVerifier.R5.get(exp,"NEED_MORE")
         }
 
         # T6: 結構形成
@@ -121,14 +152,10 @@ class SphericalUniverseVerifier:
         }
 
         # T7: 束縛演化
-        bt=[{"ep":h["ep"],"pct":h["sn"].get("bound_pct")} for h in history if h.get("sn",{}).get("bound_pct") is not None]
-        evo="UNKNOWN"
-        if len(bt)>=2:
-            d2=bt[-1]["pct"]-bt[0]["pct"]
-            evo="TIGHTENING" if d2>2 else "LOOSENING" if d2<-2 else "STABLE"
+        bt,evo=SphericalUniverseVerifier.binding_evo(history)
         results["T7"] = {
             "l":"束縛演化","data":bt,"evo":evo,
-            "r":"MATURING" if evo=="TIGHTENING" else "STABLE" if evo=="STABLE" else "DISPERSING" if evo=="LOOSENING" else "NEED_MORE"
+            "r":SphericalUniverseVerifier.R7.get(evo,"NEED_MORE")
         }
 
         # T8: 邊界膜行為（V6新增）
@@ -178,14 +205,17 @@ class ReportV6:
     def gen_summary(engine, stats, hab, bd, sv):
         sn=engine.collect_snapshot()
         best=sorted(hab, key=lambda p:abs(p["t"]-22))[:5]
-        return {
+        s={
             "v":"V6BH","rid":engine.run_id,"ts":int(time.time()),
-            "pp":PhysicsKernel.export_params(),
+            "pp":engine.pk.export_params(),
             "st":stats,"bd":bd,"sn":sn,
             "top5":best,"total_hab":len(hab),
             "epochs":engine.current_epoch,"steps":engine.total_steps_run,
             "sv":sv
         }
+        if engine.epoch_history and "mem" in engine.epoch_history[-1]:
+            s["mem"]=dict(engine.epoch_history[-1]["mem"],hab=len(hab))
+        return s
 
     @staticmethod
     def gen_chunks(engine, stats, hab, bd, sv):
@@ -224,90 +254,547 @@ class ReportV6:
 
 
 # ==========================================
-# 3. 主程式
+# 3. 精度研究與核心微基準
 # ==========================================
-if __name__=="__main__":
-    sys.stderr.write("=== V6 Black Hole Membrane Model ===\n")
-    sys.stderr.write(f"  SC={PhysicsKernel.SOLAR_CONSTANT}\n")
-    sys.stderr.write(f"  Boundary starts at {PhysicsKernel.BOUNDARY_START*100}%R\n")
-    sys.stderr.write(f"  Tidal shred at {PhysicsKernel.TIDAL_SHRED_THRESHOLD*100}%R\n\n")
-
-    engine=GenesisEngine(); loaded=False
-    stats={"tu":0,"tc":0,"hot":0,"cold":0,"noP":0,"liq":0,"ir":0}
-    bd={"Ocean":0,"Gaia":0,"Arid":0,"Desert":0,"Snowball":0,"Scorched":0,"Barren":0}
-    hab=[]
-
-    # 載入
-    prev=SaveManager.load()
-    if prev:
-        for c in prev.get("chunks",[]):
-            if c.get("type")=="SUMMARY":
-                d=c.get("data",{})
-                if "V6" in d.get("v",""):
-                    for k in stats: stats[k]=d.get("st",{}).get(k,stats[k])
-                    for k in bd: bd[k]=d.get("bd",{}).get(k,bd[k])
-                    break
-            if c.get("type")=="ENGINE":
-                engine.from_compact(c["data"]); loaded=True
+class PrecisionStudy:
+    TESTS=("T1","T2","T3","T4","T5","T6","T7","T8")
 
-    if not loaded:
-        ed=SaveManager.load_engine()
-        if ed: engine.from_compact(ed); loaded=True
+    @staticmethod
+    def run_mode(f32, n_particles, epochs, steps, seed):
+        random.seed(seed)
+        engine=GenesisEngine(); engine.big_bang(n_particles)
+        nbytes=0
+        for _ in range(epochs):
+            engine.run_epoch(steps)
+            if f32:
+                # 每個 epoch 之間以 float32 欄位停放，再還原繼續跑
+                store=CompactStore.from_engine(engine)
+                nbytes=store.nbytes()//max(len(store),1)
+                engine=store.to_engine()
+        return SphericalUniverseVerifier.analyze(engine), nbytes
 
-    if not loaded:
-        sys.stderr.write("[FRESH] Big bang\n")
-        engine.big_bang(120)
+    @staticmethod
+    def compare(n_particles=120, epochs=10, steps=300, seeds=(1,2,3)):
+        """同一種子分別跑 float64 與 float32，統計 T1–T8 判定一致率與指標偏差"""
+        agree={t:0 for t in PrecisionStudy.TESTS}; agree["VERDICT"]=0
+        dev={"T1_pct":[],"T4_cur":[],"T8_buf_pct":[]}
+        bpb=0
+        for s in seeds:
+            a,_=PrecisionStudy.run_mode(False,n_particles,epochs,steps,s)
+            b,bpb=PrecisionStudy.run_mode(True,n_particles,epochs,steps,s)
+            if "error" in a or "error" in b: continue
+            for t in PrecisionStudy.TESTS:
+                if a[t]["r"]==b[t]["r"]: agree[t]+=1
+            if a["VERDICT"]["total"]==b["VERDICT"]["total"]: agree["VERDICT"]+=1
+            dev["T1_pct"].append(abs(a["T1"]["pct"]-b["T1"]["pct"]))
+            dev["T4_cur"].append(abs(a["T4"]["cur"]-b["T4"]["cur"]))
+            dev["T8_buf_pct"].append(abs(a["T8"]["buf_pct"]-b["T8"]["buf_pct"]))
+        n=len(seeds)
+        return {
+            "runs":n,"bytes_per_body":bpb,
+            "agree":{k:f"{v}/{n}" for k,v in agree.items()},
+            "max_dev":{k:round(max(v),3) if v else 0 for k,v in dev.items()}
+        }
 
-    sys.stderr.write(f"  Engine: ep={engine.current_epoch} bodies={len(engine.bodies)}\n\n")
 
-    STEPS=300; EPOCHS = 20; INTERIM=2
-    start=engine.current_epoch; target=start+EPOCHS
-    sys.stderr.write(f"  Plan: {start} -> {target}\n\n")
+class KernelBench:
+    """積分核心微基準：同一種子下逐方法（reference）與融合（fused）路徑每天體每步的耗時（ns）"""
+
+    @staticmethod
+    def _time_engine(fused, n_particles, steps, seed):
+        random.seed(seed)
+        engine=GenesisEngine(); engine.big_bang(n_particles); engine.fused=fused
+        n=0; t=time.perf_counter()
+        for _ in range(steps):
+            n+=len(engine.bodies); engine.step()
+        return (time.perf_counter()-t)/max(n,1)*1e9, engine.get_state()
+
+    @staticmethod
+    def run(n_particles=400, steps=300, seed=1, repeat=3):
+        """取 repeat 次最小值；identical 檢查兩條路徑的最終狀態逐位元相同"""
+        ref=min(KernelBench._time_engine(False,n_particles,steps,seed)[0] for _ in range(repeat))
+        fus=min(KernelBench._time_engine(True,n_particles,steps,seed)[0] for _ in range(repeat))
+        a=KernelBench._time_engine(False,n_particles,steps//4,seed)[1]
+        b=KernelBench._time_engine(True,n_particles,steps//4,seed)[1]
+        a.pop("fused",None); b.pop("fused",None)
+        return {"ns_per_body":{"reference":round(ref),"fused":round(fus)},
+                "speedup":round(ref/max(fus,1e-9),2),"identical":a==b}
+
+
+class IndexCheck:
+    """BodyIndex 對照線性掃描：隨機探針上的 within / nearest 與 cid 查詢應逐筆相同"""
+
+    @staticmethod
+    def run(n_particles=300, steps=100, seed=1, probes=50, r=300.0, k=5):
+        random.seed(seed)
+        engine=GenesisEngine(); engine.big_bang(n_particles)
+        for _ in range(steps): engine.step()
+        rng=random.Random(seed); R=engine.pk.UNIVERSE_RADIUS; c0=engine.center_pos
+        live=[b for b in engine.bodies if b.is_active]; idx=engine.index
+        bad={"within":0,"nearest":0,"get":0}
+        for _ in range(probes):
+            x=c0+rng.uniform(-R,R); y=c0+rng.uniform(-R,R)
+            lin=[(math.hypot(b.x-x,b.y-y),b) for b in live]
+            if [b for _,b in idx.within(x,y,r)]!=[b for d,b in lin if d<=r]: bad["within"]+=1
+            if [d for d,_ in idx.nearest(x,y,k)]!=sorted(d for d,_ in lin)[:k]: bad["nearest"]+=1
+            if idx.nearest(x,y,0): bad["nearest"]+=1
+        bad["get"]=sum(idx.get(b.cid) is not b for b in live)
+        return {"probes":probes,"bodies":len(live),"mismatch":bad}
 
-    for ep in range(start, target):
-        sys.stderr.write(f"  [Ep {ep}]")
-        sys.stderr.flush()
-        engine.run_epoch(STEPS)
-        star=engine.bodies[0] if engine.bodies else None
-        if not star: continue
 
+# ==========================================
+# 4. 每個 epoch 的分析（普查 → 驗證 → 報告）
+# ==========================================
+class EpochAnalysis:
+    """epoch 結束後的全部分析；串行與管線化共用同一段程式，報告因此一致。
+    普查使用以 (run_id, ep) 播種的獨立亂數，不會擾動模擬的亂數流。
+    """
+    MEM_WARN_MB=512
+
+    def __init__(self, stats, bd, hab, start, interim, ckpt=None):
+        self.stats=stats; self.bd=bd; self.hab=hab
+        self.start=start; self.interim=interim
+        self.ckpt=ckpt
+
+    def survey(self, engine, ep):
+        star=engine.bodies[0]
+        rng=random.Random(engine.run_id*1000003+ep)
+        stats=self.stats; bd=self.bd
         ef=0
+        # 2600 幾乎涵蓋整個宇宙（R=2800），線性掃描比建格網再走訪每格便宜
         for b in engine.bodies:
             if b==star or not b.is_active: continue
             dist=math.hypot(b.x-star.x,b.y-star.y)
             if 12<b.mass<80 and 400<dist<2600:
                 stats["tc"]+=1
-                p,_=PlanetaryGeophysics.calculate_atmosphere(b.mass,b.temp)
-                h=PlanetaryGeophysics.analyze_habitability(b.temp,p,b.mass,b.composition['Vo'])
+                p,_=PlanetaryGeophysics.calculate_atmosphere(b.mass,b.temp,rng)
+                h=PlanetaryGeophysics.analyze_habitability(b.temp,p,b.mass,b.composition['Vo'],rng)
                 s=h['state']; bi=h['biome']
                 if s=="Gas": stats["hot"]+=1; bd["Scorched"]+=1
                 elif s=="Ice": stats["cold"]+=1; bd["Snowball"]+=1
                 elif s=="Sublimation": stats["noP"]+=1; bd["Barren"]+=1
                 elif s=="Liquid":
                     stats["liq"]+=1; bd[bi]=bd.get(bi,0)+1
-                    pd=DataExtraction.compact_planet(b,star,dist)
-                    pd["ep"]=ep; hab.append(pd); ef+=1
-
-        sn=engine.epoch_history[-1]["sn"] if engine.epoch_history else {}
-        sys.stderr.write(f" n={sn.get('n',0)} bound={sn.get('bound_pct','?')}%"
+                    pd=DataExtraction.compact_planet(b,star,dist,rng)
+                    pd["ep"]=ep; self.hab.append(pd); ef+=1
+        return ef
+
+    def on_epoch(self, engine, ep):
+        if not engine.bodies: return
+        ef=self.survey(engine, ep)
+        if self.ckpt: self.ckpt.save(engine,{"st":self.stats,"bd":self.bd})
+        h=engine.epoch_history[-1] if engine.epoch_history else {}
+        sn=h.get("sn",{})
+        mem=""
+        if "mem" in h:
+            mb=h["mem"]["cur"]/1024
+            mem=f" mem={mb:.1f}MB peak={h['mem']['peak']/1024:.1f}MB hab_n={len(self.hab)}"
+            if mb>self.MEM_WARN_MB: mem+=" [MEM WARN]"
+        sys.stderr.write(f"  [Ep {ep}] n={sn.get('n',0)} bound={sn.get('bound_pct','?')}%"
                          f" buf={sn.get('buf_pct','?')}% uni={sn.get('uni','?')}"
-                         f" rec={engine.recycled_count} hab={ef}\n")
+                         f" rec={engine.recycled_count} hab={ef}{mem}\n")
 
-        if (ep-start+1)%INTERIM==0:
-            stats["ir"]+=1
+        if (ep-self.start+1)%self.interim==0:
+            self.stats["ir"]+=1
             sv=SphericalUniverseVerifier.analyze(engine)
-            chunks=ReportV6.gen_chunks(engine,stats,hab,bd,sv)
+            chunks=ReportV6.gen_chunks(engine,self.stats,self.hab,self.bd,sv)
             ReportV6.save(chunks,"INTERIM")
             v=sv.get("VERDICT",{})
             sys.stderr.write(f"    >> {v.get('total','?')} {v.get('interp','?')}\n\n")
+        sys.stderr.flush()
+
+    def finish(self, engine):
+        sys.stderr.write("\n=== Final ===\n")
+        sv=SphericalUniverseVerifier.analyze(engine)
+        chunks=ReportV6.gen_chunks(engine,self.stats,self.hab,self.bd,sv)
+        ReportV6.save(chunks,"FINAL")
+        v=sv.get("VERDICT",{})
+        sys.stderr.write(f"  Score: {v.get('total','?')}\n")
+        sys.stderr.write(f"  {v.get('interp','?')}\n")
+        sys.stderr.write(f"  {v.get('summary','')}\n")
+        sys.stderr.write(f"  -> RESULT.txt\n")
+        sys.stderr.flush()
+
 
-    sys.stderr.write("\n=== Final ===\n")
-    sv=SphericalUniverseVerifier.analyze(engine)
-    chunks=ReportV6.gen_chunks(engine,stats,hab,bd,sv)
-    ReportV6.save(chunks,"FINAL")
-    v=sv.get("VERDICT",{})
-    sys.stderr.write(f"  Score: {v.get('total','?')}\n")
-    sys.stderr.write(f"  {v.get('interp','?')}\n")
-    sys.stderr.write(f"  {v.get('summary','')}\n")
-    sys.stderr.write(f"  -> RESULT.txt\n")
+def _analysis_worker(analysis, q, err):
+    try:
+        while True:
+            item=q.get()
+            if item is None: break
+            kind,ep,st=item
+            engine=GenesisEngine.from_state(st)
+            if kind=="final": analysis.finish(engine)
+            else: analysis.on_epoch(engine, ep)
+    except BaseException:
+        import traceback
+        err.put(traceback.format_exc())
+        raise
+
+
+class PipelinedRunner:
+    """epoch N 的分析交給背景行程，主行程立刻開始模擬 epoch N+1。
+    交接的是 get_state() 的完整精度快照（已丟棄失效天體），worker 端重建
+    引擎後執行與串行完全相同的 EpochAnalysis。佇列上限 2，分析跟不上時
+    主行程會等待，不會無限堆積快照。worker 出錯時把 traceback 送回錯誤佇列，
+    主行程在下一次交接或 finish 時以 RuntimeError 重新拋出，不會卡在滿的佇列上；
+    主行程自己出錯時 abort() 結束 worker（daemon 行程，直譯器結束時也不會等它）。
+    """
+    POLL=0.5
+
+    def __init__(self, analysis):
+        import multiprocessing
+        self.q=multiprocessing.Queue(maxsize=2)
+        self.err=multiprocessing.Queue()
+        self.proc=multiprocessing.Process(target=_analysis_worker,args=(analysis,self.q,self.err),daemon=True)
+        self.proc.start()
+
+    def _fail(self):
+        import queue
+        self.proc.join()
+        self.q.cancel_join_thread()     # 佇列裡剩下的快照沒人會讀，結束時不必等它送完
+        try: tb=self.err.get(timeout=self.POLL)
+        except queue.Empty: tb=""
+        raise RuntimeError(f"analysis worker exited with code {self.proc.exitcode}\n{tb}")
+
+    def _put(self, item):
+        import queue
+        while True:
+            if not self.proc.is_alive(): self._fail()
+            try:
+                self.q.put(item,timeout=self.POLL); return
+            except queue.Full: pass
+
+    def on_epoch(self, engine, ep):
+        self._put(("epoch",ep,engine.get_state()))
+
+    def abort(self):
+        """主行程出錯時直接結束 worker，不再送快照"""
+        self.q.cancel_join_thread()
+        self.proc.terminate(); self.proc.join()
+
+    def finish(self, engine):
+        self._put(("final",engine.current_epoch,engine.get_state()))
+        self._put(None)
+        self.proc.join()
+        if self.proc.exitcode: self._fail()
+
+
+class RunController:
+    """依收斂調整 epoch 數。每個 epoch 後記錄快照指標（bound_pct、uni、avg_d、
+    每百體合併數 mr）與 T4/T5/T7 判定：判定連續 window 個 epoch 不變、且指標
+    最近兩個窗口的平均漂移都在容差內，就提前停止；到了預定 epoch 數而 T5 仍是
+    NEED_MORE 則延長，最多到 max_epochs。
+    """
+    METRICS=("bound_pct","uni","avg_d","mr")
+    TOL={"bound_pct":0.03,"uni":0.1,"avg_d":0.05,"mr":0.3}   # 相對 max(|前窗平均|,1)
+    PENDING=("NEED_MORE","NOT_YET")
+
+    def __init__(self, planned, min_epochs=6, max_epochs=None, window=3, tol=None, merges0=0):
+        self.planned=planned; self.min_epochs=min_epochs
+        self.max_epochs=max_epochs or planned*2
+        self.window=window; self.tol=dict(self.TOL,**(tol or {}))
+        self.rows=[]; self.verdicts=[]; self.merges=merges0
+        self.reason=None; self.secs=0.0; self.t=time.perf_counter()
+
+    def drift(self):
+        w=self.window
+        if len(self.rows)<2*w: return None
+        out={}
+        for k in self.METRICS:
+            a=[r[k] for r in self.rows[-2*w:-w]]; b=[r[k] for r in self.rows[-w:]]
+            if None in a or None in b: return None
+            ma=sum(a)/w; mb=sum(b)/w
+            out[k]=abs(mb-ma)/max(abs(ma),1.0)
+        return out
+
+    def converged(self):
+        w=self.window
+        if len(self.rows)<self.min_epochs or len(self.verdicts)<w: return False
+        last=self.verdicts[-w:]
+        if any(v!=last[0] for v in last) or any(r in self.PENDING for r in last[0].values()): return False
+        d=self.drift()
+        return d is not None and all(d[k]<=self.tol[k] for k in d)
+
+    def observe(self, history, merges):
+        """每個 epoch 之後呼叫；回傳 False 表示該停了"""
+        now=time.perf_counter(); self.secs+=now-self.t; self.t=now
+        sn=history[-1].get("sn",{}) if history else {}
+        n=sn.get("n",0)
+        row={k:sn.get(k) for k in ("bound_pct","uni","avg_d")}
+        row["mr"]=(merges-self.merges)/n*100 if n else None
+        self.merges=merges
+        self.rows.append(row)
+        self.verdicts.append(SphericalUniverseVerifier.trend_verdicts(history))
+        k=len(self.rows)
+        if k>=self.max_epochs: self.reason="max"
+        elif self.converged(): self.reason="converged"
+        elif k>=self.planned and self.verdicts[-1]["T5"]!="NEED_MORE": self.reason="planned"
+        return self.reason is None
+
+    def report(self, steps):
+        k=len(self.rows); saved=self.planned-k
+        per=self.secs/max(k,1)
+        return {"planned":self.planned,"run":k,"reason":self.reason or "running",
+                "saved_epochs":saved,"saved_steps":saved*steps,"saved_s":round(saved*per,2),
+                "verdicts":self.verdicts[-1] if self.verdicts else {},
+                "drift":{m:round(v,3) for m,v in (self.drift() or {}).items()}}
 
+    @staticmethod
+    def sweep(sw, planned, steps, **kw):
+        """多宇宙批次：每個宇宙各自一個控制器，收斂即凍結，其餘繼續跑"""
+        ctl=[RunController(planned,merges0=sw.merge_events[u],**kw) for u in range(sw.n_uni)]
+        t=time.perf_counter(); ue=0
+        while not all(sw.frozen):
+            ue+=sw.n_uni-sum(sw.frozen)
+            sw.run_epoch(steps)
+            for u,c in enumerate(ctl):
+                if not sw.frozen[u] and not c.observe(sw.epoch_history[u],sw.merge_events[u]):
+                    sw.freeze(u)
+        per=(time.perf_counter()-t)/max(ue,1)     # 每宇宙 epoch 的平均耗時
+        reps=[]
+        for c in ctl:
+            r=c.report(steps); r["saved_s"]=round(r["saved_epochs"]*per,2); reps.append(r)
+        saved=sum(r["saved_epochs"] for r in reps)
+        return {"universes":reps,"universe_epochs":ue,"saved_epochs":saved,
+                "saved_s":round(saved*per,2)}
+
+
+# ==========================================
+# 5. 存檔視圖與子命令
+# ==========================================
+class SavedRun:
+    """存檔的惰性視圖。摘要只讀 report_summary.json（數 KB）；state.json
+    與增量檢查點第一次用到時才解析，引擎只在真正需要天體時重建。
+    """
+    def __init__(self):
+        self._summary=None; self._state=None; self._ckpt=None; self._engine=None
+
+    @staticmethod
+    def fresh_tallies():
+        stats={"tu":0,"tc":0,"hot":0,"cold":0,"noP":0,"liq":0,"ir":0}
+        bd={"Ocean":0,"Gaia":0,"Arid":0,"Desert":0,"Snowball":0,"Scorched":0,"Barren":0}
+        return stats,bd,[]
+
+    @staticmethod
+    def clear_streams():
+        """重新開始時丟掉上一輪的事件流、密度場與增量檢查點，避免新舊步數交錯"""
+        for p in (EVENT_FILE,EVENT_FILE+".ckpt",FIELD_FILE):
+            if os.path.exists(p): os.remove(p)
+        if os.path.exists(CKPT_DIR):
+            for n in os.listdir(CKPT_DIR):
+                if n.endswith(".bin"): os.remove(os.path.join(CKPT_DIR,n))
+
+    def summary(self):
+        if self._summary is None:
+            self._summary={}
+            try:
+                with open(REPORT_FILE) as f: self._summary=json.load(f).get("data",{})
+            except: pass
+        return self._summary
+
+    def ckpt(self):
+        if self._ckpt is None: self._ckpt=DeltaCheckpointer.peek() or {}
+        return self._ckpt
+
+    def state(self):
+        if self._state is None: self._state=SaveManager.load() or {}
+        return self._state
+
+    def epoch(self):
+        if self._engine: return self._engine.current_epoch
+        return max(self.summary().get("epochs",0),self.ckpt().get("epoch",0))
+
+    def cached_sv(self):
+        """摘要裡的驗證結果已涵蓋最新檢查點時直接沿用"""
+        sm=self.summary(); sv=sm.get("sv",{})
+        if "VERDICT" in sv and sm.get("epochs",-1)>=self.ckpt().get("epoch",0): return sv
+        return None
+
+    def tallies(self, with_hab=True):
+        """普查統計；增量檢查點不比摘要舊且帶有統計時以它為準（state.json 每 INTERIM
+        個 epoch 才寫一次，奇數 epoch 停下時會少一個 epoch 的普查）。
+        with_hab=False 且統計已由檢查點取得時不解析 state.json。"""
+        stats,bd,hab=self.fresh_tallies(); seen=False
+        ck=self.ckpt(); sm=self.summary(); tl=ck.get("tallies")
+        if tl and (not sm or ck["epoch"]>=sm.get("epochs",0)):
+            for k in stats: stats[k]=tl.get("st",{}).get(k,stats[k])
+            for k in bd: bd[k]=tl.get("bd",{}).get(k,bd[k])
+            seen=True
+            if not with_hab: return stats,bd,hab
+        for c in self.state().get("chunks",[]):
+            t=c.get("type")
+            if t=="SUMMARY" and not seen:
+                d=c.get("data",{})
+                if "V6" in d.get("v",""):
+                    for k in stats: stats[k]=d.get("st",{}).get(k,stats[k])
+                    for k in bd: bd[k]=d.get("bd",{}).get(k,bd[k])
+                    seen=True
+            elif t=="PLANETS": hab.extend(c.get("data",[]))
+        return stats,bd,hab
+
+    def engine(self):
+        """增量檢查點不比摘要舊時直接由它重建（保留緩衝帶旗標與完整歷史），
+        不必解析 state.json 的 ENGINE 區塊；沒有存檔時回傳 None"""
+        if self._engine is None:
+            e=None; ck=self.ckpt(); sm=self.summary()
+            if not ck or not sm or ck["epoch"]<sm.get("epochs",0):
+                ed=next((c["data"] for c in reversed(self.state().get("chunks",[])) if c.get("type")=="ENGINE"),None)
+                if ed: e=GenesisEngine(); e.from_compact(ed)
+            if ck and (e is None or ck["epoch"]>=e.current_epoch): e=DeltaCheckpointer.load()
+            self._engine=e
+        return self._engine
+
+
+class Commands:
+    """d.py 的子命令。simulate / resume 會推進模擬；verify / inspect 只讀快取
+    摘要與檔案表頭，report 才需要重建引擎。
+    """
+    # simulate / resume 的執行選項；不帶子命令時也以此為預設
+    RUN_DEFAULTS={"epochs":20,"steps":300,"fixed":False,"serial":False,"events":True,
+                  "fields":True,"checkpoints":True,"mem_trace":False,"ccd":False,"thermal_tol":0.0}
+
+    @staticmethod
+    def add_run_args(sp):
+        sp.add_argument("--epochs",type=int,help="預定 epoch 數（自適應時可能提前停止或延長）")
+        sp.add_argument("--steps",type=int,help="每個 epoch 的步數")
+        sp.add_argument("--fixed",action="store_true",help="固定跑滿 --epochs，不做收斂判斷")
+        sp.add_argument("--serial",action="store_true",help="分析在主行程串行執行")
+        sp.add_argument("--no-events",dest="events",action="store_false",help="不寫事件流")
+        sp.add_argument("--no-fields",dest="fields",action="store_false",help="不寫密度場")
+        sp.add_argument("--no-checkpoints",dest="checkpoints",action="store_false",help="不寫增量檢查點")
+        sp.add_argument("--mem-trace",action="store_true",help="每個 epoch 的記憶體量測")
+        sp.add_argument("--ccd",action="store_true",help="連續碰撞偵測")
+        sp.add_argument("--thermal-tol",type=float,help="熱力學快轉容差（0 = 每步精確）")
+        sp.set_defaults(**Commands.RUN_DEFAULTS)
+
+    @staticmethod
+    def simulate(a):
+        sys.stderr.write("=== V6 Black Hole Membrane Model ===\n")
+        SavedRun.clear_streams()
+        sys.stderr.write("[FRESH] Big bang\n")
+        engine=GenesisEngine(); engine.big_bang(a.bodies)
+        Commands.run(engine,*SavedRun.fresh_tallies(),a)
+
+    @staticmethod
+    def resume(a):
+        sys.stderr.write("=== V6 Black Hole Membrane Model ===\n")
+        run=SavedRun()
+        stats,bd,_=run.tallies(with_hab=False)
+        engine=run.engine()
+        if engine is None:
+            sys.stderr.write("[FRESH] Big bang\n")
+            engine=GenesisEngine(); engine.big_bang(120)
+        Commands.run(engine,stats,bd,[],a)
+
+    @staticmethod
+    def run(engine, stats, bd, hab, a):
+        pk=engine.pk
+        sys.stderr.write(f"  SC={pk.SOLAR_CONSTANT}\n")
+        sys.stderr.write(f"  Boundary starts at {pk.BOUNDARY_START*100}%R\n")
+        sys.stderr.write(f"  Tidal shred at {pk.TIDAL_SHRED_THRESHOLD*100}%R\n")
+        sys.stderr.write(f"  Engine: ep={engine.current_epoch} bodies={len(engine.bodies)}\n\n")
+
+        EPOCHS=a.epochs; STEPS=a.steps; INTERIM=2; EVENT_CKPT=5
+        engine.ccd=a.ccd; engine.thermal_tol=a.thermal_tol; engine.mem_trace=a.mem_trace
+        if a.events:
+            SaveManager.ensure_dir()
+            engine.event_log=EventLog(EVENT_FILE, checkpoint_every=STEPS*EVENT_CKPT,
+                                      at_step=engine.total_steps_run)
+        if a.fields:
+            SaveManager.ensure_dir()
+            engine.field_stream=FieldStream(FIELD_FILE, every=STEPS)
+        start=engine.current_epoch; target=start+EPOCHS
+        ctl=None if a.fixed else RunController(EPOCHS,merges0=engine.merge_events)
+        sys.stderr.write(f"  Plan: {start} -> {target}"
+                         f"{f' (adaptive, max {start+ctl.max_epochs})' if ctl else ''}\n\n")
+
+        analysis=EpochAnalysis(stats,bd,hab,start,INTERIM,
+                               DeltaCheckpointer() if a.checkpoints else None)
+        runner=analysis if a.serial else PipelinedRunner(analysis)
+
+        ep=start
+        try:
+            while ctl or ep<target:
+                engine.run_epoch(STEPS)
+                if engine.bodies: runner.on_epoch(engine, ep)
+                ep+=1
+                if ctl and not ctl.observe(engine.epoch_history, engine.merge_events): break
+        except BaseException:
+            if runner is not analysis: runner.abort()
+            raise
+        finally:
+            if engine.event_log: engine.event_log.close()
+            if engine.field_stream: engine.field_stream.close()
+
+        if ctl:
+            r=ctl.report(STEPS)
+            sys.stderr.write(f"  [CTL] {r['reason']} at ep {ep-1}: ran {r['run']}/{r['planned']} epochs,"
+                             f" saved {r['saved_epochs']} epochs ({r['saved_steps']} steps, ~{r['saved_s']}s)"
+                             f" T4/T5/T7={'/'.join(r['verdicts'].values())}\n")
+
+        runner.finish(engine)
+
+    @staticmethod
+    def verify(a):
+        run=SavedRun(); src="cache"
+        sv=None if a.fresh else run.cached_sv()
+        if sv is None:
+            engine=run.engine()
+            if engine is None:
+                sys.stderr.write("[VERIFY] no save\n"); return 1
+            sv=SphericalUniverseVerifier.analyze(engine); src="engine"
+        v=sv.get("VERDICT",{})
+        out={"ep":run.epoch(),"src":src,"total":v.get("total"),"interp":v.get("interp"),
+             "r":{t:sv[t]["r"] for t in PrecisionStudy.TESTS if t in sv}}
+        if "error" in sv: out["error"]=sv["error"]
+        print(json.dumps(out,ensure_ascii=False,separators=(',',':')))
+
+    @staticmethod
+    def report(a):
+        run=SavedRun()
+        engine=run.engine()
+        if engine is None:
+            sys.stderr.write("[REPORT] no save\n"); return 1
+        stats,bd,hab=run.tallies()
+        sv=SphericalUniverseVerifier.analyze(engine)
+        ReportV6.save(ReportV6.gen_chunks(engine,stats,hab,bd,sv),"REPORT")
+
+    @staticmethod
+    def inspect(a):
+        run=SavedRun(); sm=run.summary(); ck=run.ckpt()
+        files={os.path.basename(p):os.path.getsize(p)
+               for p in (SAVE_FILE,REPORT_FILE,SV_FILE,EVENT_FILE,EVENT_FILE+".ckpt",FIELD_FILE)
+               if os.path.exists(p)}
+        out={"rid":sm.get("rid"),"ep":sm.get("epochs"),"steps":sm.get("steps"),
+             "n":sm.get("sn",{}).get("n"),"pp":sm.get("pp"),
+             "verdict":sm.get("sv",{}).get("VERDICT",{}).get("total"),
+             "ckpt":ck or None,"stale":bool(ck) and ck["epoch"]>sm.get("epochs",-1),
+             "events":files.get(os.path.basename(EVENT_FILE),0)//EventLog.REC.size,
+             "files":files}
+        if files.get(os.path.basename(FIELD_FILE)):
+            with open(FIELD_FILE,'rb') as f: h=FieldStream.HDR.unpack(f.read(FieldStream.HDR.size))
+            out["fields"]=files[os.path.basename(FIELD_FILE)]//FieldStream.frame_size(h[3],h[4])
+        print(json.dumps(out,ensure_ascii=False,separators=(',',':')))
+
+
+# ==========================================
+# 6. 主程式
+# ==========================================
+if __name__=="__main__":
+    import argparse
+    p=argparse.ArgumentParser(prog="d.py",description="V6 Black Hole Membrane Model")
+    sub=p.add_subparsers(dest="cmd")
+    for name,h in (("simulate","從大爆炸重新開始"),("resume","載入存檔續跑（預設）")):
+        sp=sub.add_parser(name,help=h)
+        Commands.add_run_args(sp)
+        if name=="simulate": sp.add_argument("--bodies",type=int,default=120)
+    sp=sub.add_parser("verify",help="T1–T8 判定；摘要已是最新時不重建引擎")
+    sp.add_argument("--fresh",action="store_true",help="忽略快取，重建引擎重算")
+    sub.add_parser("report",help="由存檔重建引擎並重新產生報告")
+    sub.add_parser("inspect",help="只讀摘要與檔案表頭")
+    p.set_defaults(cmd="resume",**Commands.RUN_DEFAULTS)
+    a=p.parse_args()
+
+    if a.cmd in ("simulate","resume") and a.mem_trace:
+        import tracemalloc; tracemalloc.start()    # 在載入前開始，初始天體也計入
+    sys.exit(getattr(Commands,a.cmd)(a) or 0)